@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the MQTT scheduler.
+
+Runs the real scheduler code against an in-process fake client, so no broker or
+network is needed and results are reproducible. Results are written as JSON so
+runs can be compared for regressions.
+
+Usage:
+    python benchmark.py                          # full run
+    python benchmark.py --quick                  # smaller sizes, for a fast sanity check
+    python benchmark.py --compare previous.json  # print the change against an earlier run
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import event_log
+from event_log import EventLog
+from job_store import JobStore
+from mqtt5 import Mqtt5Publisher
+from publisher_pool import PublisherPool
+from rate_limiter import RateLimiter
+from scheduler_engine import SchedulerConfig, SchedulerEngine
+from simulate import simulate
+from timer_engine import TimerEngine
+
+
+# =================================================================
+# --- IN-PROCESS BROKER STAND-IN ---
+# =================================================================
+
+class FakeMessageInfo:
+    """Mimics paho's MQTTMessageInfo: indexable as (rc, mid) and already acknowledged."""
+
+    def __init__(self, mid):
+        self.rc = 0
+        self.mid = mid
+
+    def __getitem__(self, index):
+        return (self.rc, self.mid)[index]
+
+    def is_published(self):
+        return True
+
+
+class FakeClient:
+    """Stands in for paho's Client. Accepts every publish in-process and remembers the last one per topic."""
+
+    def __init__(self):
+        self.published = 0
+        self.bytes_out = 0
+        self.last_payload = {}
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published += 1
+        self.bytes_out += len(topic) + len(payload or "")
+        self.last_payload[topic] = payload
+        return FakeMessageInfo(self.published)
+
+    def subscribe(self, topic, qos=0, options=None, properties=None):
+        return (0, 0)
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload.encode('utf-8') if isinstance(payload, str) else payload
+
+
+def reset_scheduler(keep_files=False, **settings):
+    """A fresh engine on a fake client, with changes applied inline unless `settings` say otherwise."""
+    config = SchedulerConfig(**{"ingest_worker": False, **settings})
+    engine = SchedulerEngine(config, client=FakeClient())
+    if not keep_files:
+        engine.persistence.save_schedules([])
+    return engine
+
+
+def send(engine, topic, payload):
+    engine.on_message(engine.client, None, FakeMessage(topic, payload))
+
+
+def make_job(index, job_type="daily"):
+    if job_type == "interval":
+        return {"type": "interval", "topic": f"bench/device-{index}/command", "payload": "PING", "time": 60 + index % 600}
+    return {"type": job_type, "topic": f"bench/device-{index}/command", "payload": "OFF",
+            "time": f"{index % 24:02d}:{index % 60:02d}"}
+
+
+# =================================================================
+# --- BENCHMARKS ---
+# =================================================================
+
+def bench_submission_throughput(count):
+    """Jobs accepted per second, one per message and in batches of 1000."""
+    engine = reset_scheduler()
+    started = time.perf_counter()
+    for index in range(count):
+        send(engine, engine.config.control_topic, json.dumps(make_job(index)))
+    single_elapsed = time.perf_counter() - started
+
+    engine = reset_scheduler()
+    started = time.perf_counter()
+    for first in range(0, count, 1000):
+        batch = [make_job(index) for index in range(first, min(first + 1000, count))]
+        send(engine, engine.config.control_topic, json.dumps(batch))
+    batch_elapsed = time.perf_counter() - started
+
+    return {
+        "jobs": count,
+        "single_jobs_per_second": round(count / single_elapsed, 1),
+        "batch_jobs_per_second": round(count / batch_elapsed, 1),
+    }
+
+
+def bench_duplicate_check(sizes, lookups=10000):
+    """Average cost of rejecting a duplicate submission at different store sizes."""
+    results = {}
+    for size in sizes:
+        store = JobStore()
+        for index in range(size):
+            store.add(make_job(index))
+
+        probes = [make_job(index * (size // lookups or 1) % size) for index in range(lookups)]
+        started = time.perf_counter()
+        for job in probes:
+            store.add(job)
+        elapsed = time.perf_counter() - started
+        results[str(size)] = {"microseconds_per_check": round(elapsed / lookups * 1e6, 3)}
+    return results
+
+
+def bench_fire_drift(job_count, interval, duration):
+    """Fire drift while `job_count` interval jobs fire every `interval` seconds for `duration` seconds."""
+    engine = reset_scheduler()
+    jobs = [{"type": "interval", "topic": f"bench/load-{index}", "payload": "X", "time": interval}
+            for index in range(job_count)]
+    engine.submit_job_batch([(job, None) for job in jobs])
+    engine.metrics.report()  # Start the measurement window now
+
+    runner = threading.Thread(target=engine.timers.run_forever)
+    runner.start()
+    time.sleep(duration)
+    engine.timers.stop()
+    runner.join()
+
+    report = engine.metrics.report()
+    return {
+        "jobs": job_count,
+        "interval_seconds": interval,
+        "fires_per_second": report["fires_per_second"],
+        "drift_ms": report["fire_drift_ms"],
+    }
+
+
+def bench_list_latency(job_count, page_size=100):
+    """Time to serve the first page, a filtered page and a full paginated walk."""
+    engine = reset_scheduler()
+    engine.submit_job_batch([(make_job(index), None) for index in range(job_count)])
+    reply_topic = "bench/reply"
+
+    def timed_request(request):
+        started = time.perf_counter()
+        send(engine, engine.config.list_jobs_topic, json.dumps({**request, "reply_to": reply_topic}))
+        return time.perf_counter() - started, json.loads(engine.client.last_payload[reply_topic])
+
+    first_page, reply = timed_request({"limit": page_size})
+    cached_page, _ = timed_request({"limit": page_size})
+    filtered, _ = timed_request({"limit": page_size, "topic_prefix": f"bench/device-{job_count - 1}/"})
+    not_modified, _ = timed_request({"since_version": reply["version"], "epoch": reply["epoch"]})
+
+    walk_elapsed, cursor, pages = 0.0, 0, 0
+    while cursor is not None:
+        elapsed, reply = timed_request({"limit": page_size, "cursor": cursor})
+        walk_elapsed += elapsed
+        cursor = reply["next_cursor"]
+        pages += 1
+
+    return {
+        "jobs": job_count,
+        "first_page_ms": round(first_page * 1000, 3),
+        "cached_page_ms": round(cached_page * 1000, 3),
+        "not_modified_ms": round(not_modified * 1000, 3),
+        "filtered_page_ms": round(filtered * 1000, 3),
+        "full_walk_ms": round(walk_elapsed * 1000, 3),
+        "pages": pages,
+    }
+
+
+def bench_ingest(count):
+    """
+    Time paho's network thread spends per single-job submission when changes are applied
+    and committed inline versus queued for the mutation worker, plus end-to-end throughput.
+    """
+    results = {}
+    for mode in ("inline", "worker"):
+        engine = reset_scheduler(ingest_worker=(mode == "worker"))
+        engine.start_ingest()
+        messages = [FakeMessage(engine.config.control_topic, json.dumps(make_job(index))) for index in range(count)]
+
+        started = time.perf_counter()
+        slowest = 0.0
+        for message in messages:
+            handled = time.perf_counter()
+            engine._on_message_locked(engine.client, None, message)
+            slowest = max(slowest, time.perf_counter() - handled)
+        network_elapsed = time.perf_counter() - started
+        if engine.ingest is not None:
+            engine.ingest.stop()
+        elapsed = time.perf_counter() - started
+
+        report = engine.metrics.report()
+        results[mode] = {
+            "network_thread_us_per_message": round(network_elapsed / count * 1e6, 1),
+            "network_thread_max_ms": round(slowest * 1000, 3),
+            "jobs_per_second": round(count / elapsed, 1),
+            "commits": report["commit_time_ms"]["count"],
+            "ingest_latency_p99_ms": report["ingest_latency_ms"]["p99"],
+        }
+    return {"jobs": count, **results}
+
+
+def bench_startup(job_count, journal_records=500):
+    """Time for restore_jobs() to reload `job_count` persisted jobs from a snapshot plus journal."""
+    engine = reset_scheduler()
+    snapshot_jobs = [make_job(index) for index in range(job_count - journal_records)]
+    engine.persistence.save_schedules(snapshot_jobs)
+    for index in range(job_count - journal_records, job_count):
+        engine.persistence.journal_add(make_job(index))
+    engine.persistence.commit_schedules()
+
+    engine = reset_scheduler(keep_files=True)
+
+    started = time.perf_counter()
+    restored = engine.restore_jobs()
+    elapsed = time.perf_counter() - started
+    return {
+        "jobs": restored,
+        "seconds": round(elapsed, 3),
+        "jobs_per_second": round(restored / elapsed, 1),
+    }
+
+
+def bench_engine_host(engines, jobs_per_engine, interval, duration):
+    """
+    `engines` schedulers in one process on one shared TimerEngine: time to restore all of
+    them from disk, then the combined fire rate and worst per-engine drift while their
+    interval jobs fire for `duration` seconds on the single timer thread.
+    """
+    timers = TimerEngine()
+    configs = [SchedulerConfig(ingest_worker=False, schedule_file=f"engine{index}.json",
+                               journal_file=f"engine{index}.journal", outbox_file=f"engine{index}.outbox")
+               for index in range(engines)]
+    for index, config in enumerate(configs):
+        jobs = [{"type": "interval", "topic": f"bench/engine-{index}/load-{job}", "payload": "X", "time": interval}
+                for job in range(jobs_per_engine)]
+        SchedulerEngine(config, client=FakeClient()).persistence.save_schedules(jobs)
+
+    started = time.perf_counter()
+    hosted = [SchedulerEngine(config, timers=timers, client=FakeClient()) for config in configs]
+    for engine in hosted:
+        engine.restore_jobs()
+    restore_elapsed = time.perf_counter() - started
+    for engine in hosted:
+        engine.metrics.report()  # Start the measurement window now
+
+    runner = threading.Thread(target=timers.run_forever)
+    runner.start()
+    time.sleep(duration)
+    timers.stop()
+    runner.join()
+
+    reports = [engine.metrics.report() for engine in hosted]
+    return {
+        "engines": engines,
+        "jobs": engines * jobs_per_engine,
+        "restore_seconds": round(restore_elapsed, 3),
+        "fires_per_second": round(sum(report["fires_per_second"] for report in reports), 1),
+        "worst_engine_drift_p99_ms": max(report["fire_drift_ms"]["p99"] or 0 for report in reports),
+    }
+
+
+def bench_hot_reload(job_count, changed):
+    """Time to apply an external edit of the schedule file that removes and adds `changed` jobs each."""
+    engine = reset_scheduler()
+    engine.submit_job_batch([(make_job(index), None) for index in range(job_count)])
+    engine.persistence.save_schedules(engine.store.jobs())
+
+    with open(engine.config.schedule_file) as f:
+        jobs = json.load(f)
+    jobs = jobs[changed:] + [make_job(index, "interval") for index in range(changed)]
+    time.sleep(0.01)  # Make sure the edit gets a new modification time
+    with open(engine.config.schedule_file, 'w') as f:
+        json.dump(jobs, f)
+
+    summary = engine.reload_schedule_file()
+    return {key: summary[key] for key in ("added", "removed", "total_jobs", "diff_ms", "apply_ms", "total_ms")}
+
+
+def bench_burst_drain(messages, pool_sizes, rate):
+    """
+    Drain time of one synchronized burst of `messages` job publishes through the publisher
+    pool at each pool size, then again with a `rate` messages/second limit.
+    """
+    def drain(pool_size, limiter):
+        engine = reset_scheduler()
+        engine.publishers = PublisherPool(
+            lambda index: FakeClient(), pool_size,
+            lambda publisher, topic, payload, qos, retain: engine._publish_now(topic, payload, qos, retain, publisher),
+            limiter=limiter, bursts=engine.bursts)
+        engine.publishers.start("localhost", 1883, 60)
+        for index in range(messages):
+            engine.publish_status(f"bench/device-{index}/command", "OFF")
+        engine.publishers.stop()
+        largest = engine.metrics.report()["largest_burst"]
+        return {"drain_ms": largest["drain_ms"], "messages_per_second": round(messages / largest["drain_ms"] * 1000, 1)}
+
+    results = {f"pool_{size}": drain(size, None) for size in pool_sizes}
+    results[f"pool_{pool_sizes[-1]}_limited_{rate}_per_second"] = drain(pool_sizes[-1], RateLimiter(rate, burst=100))
+    return results
+
+
+def bench_mqtt5_wire_bytes(topics, fires_per_topic, alias_maximums):
+    """
+    Bytes on the wire saved by MQTT 5 topic aliases (net of the property overhead, including
+    a 300 s message expiry) when `topics` recurring job topics each fire `fires_per_topic` times.
+    """
+    results = {}
+    for alias_maximum in alias_maximums:
+        publisher = Mqtt5Publisher(expiry_seconds=300)
+        publisher.reset(alias_maximum)
+        fake = FakeClient()
+        for _ in range(fires_per_topic):
+            for index in range(topics):
+                publisher.publish(fake, f"bench/device-{index}/command", "OFF")
+        stats = publisher.stats()
+        # Fixed header + topic length + topic + payload of each PUBLISH under MQTT 3.1.1
+        v311_bytes = sum(2 + 2 + len(f"bench/device-{index}/command") + 3 for index in range(topics)) * fires_per_topic
+        results[f"alias_max_{alias_maximum}"] = {
+            "aliased_publishes": stats["aliased_publishes"],
+            "net_bytes_saved": stats["net_bytes_saved"],
+            "percent_of_mqtt311_bytes": round(stats["net_bytes_saved"] / v311_bytes * 100, 1),
+        }
+    return {"topics": topics, "fires_per_topic": fires_per_topic, **results}
+
+
+def bench_event_log(count):
+    """
+    Time the firing thread spends per publish log line: a direct print() with strftime as
+    before, the queued EventLog, and the EventLog sampling 1 in 100. Output goes to a file.
+    """
+    def timed(log_fn):
+        started = time.perf_counter()
+        for index in range(count):
+            log_fn(f"bench/device-{index % 1000}/command", "OFF")
+        return time.perf_counter() - started
+
+    results = {}
+    with open("event_log_bench.txt", 'w') as stream:
+        def direct(topic, payload):
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] PUBLISHED: '{payload}' to Topic: {topic}", file=stream)
+        results["print_us_per_event"] = round(timed(direct) / count * 1e6, 3)
+
+        for name, sample_rates in (("queued", None), ("queued_sampled_100", {"publish": 100})):
+            writer = event_log._LogWriter(stream=stream, maxsize=count)
+            log = EventLog(sample_rates=sample_rates, writer=writer)
+            elapsed = timed(lambda topic, payload: log.info("publish", "PUBLISHED: '{payload}' to Topic: {topic}",
+                                                            topic=topic, payload=payload))
+            writer.flush(timeout=60)
+            results[f"{name}_us_per_event"] = round(elapsed / count * 1e6, 3)
+    return {"events": count, **results}
+
+
+def bench_simulation(count):
+    """Wall time to replay 24 virtual hours of `count` jobs (1% of them interval jobs) with simulate.py."""
+    jobs = [make_job(index, "interval" if index % 100 == 0 else "daily") for index in range(count)]
+    report = simulate(jobs)
+    return {
+        "jobs": report["jobs"],
+        "fires": report["fires"],
+        "schedule_seconds": report["schedule_seconds"],
+        "simulation_seconds": report["simulation_seconds"],
+        "fires_per_second": round(report["fires"] / report["simulation_seconds"], 1),
+        "peak_publishes_per_second": report["peak_publishes_per_second"],
+    }
+
+
+def bench_memory_per_job(count):
+    """
+    Memory retained per job (index entry, timer, heap entry and whatever is kept once it
+    has fired), measured with tracemalloc before and after every job has fired once.
+    """
+    # Compacting every 1000 submissions would rewrite a snapshot of up to `count` jobs each time
+    engine = reset_scheduler(compact_after_records=count + 1)
+    # Submissions arrive as JSON text, so the parsed dicts are allocated inside the measurement like in production
+    texts = [json.dumps(make_job(index, "interval" if index % 2 else "daily")) for index in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for first in range(0, count, 1000):
+            engine.submit_job_batch([(json.loads(text), None) for text in texts[first:first + 1000]])
+        gc.collect()
+        scheduled = tracemalloc.get_traced_memory()[0] - before
+
+        # Fire every job once, each with a different drift, so per-job metrics would show up here
+        job_ids = list(engine.job_timers)
+        for index, job_id in enumerate(job_ids):
+            engine.timers.late_by = (index % 10000) / 1e6
+            engine._fire_job(job_id)
+        del job_ids
+        engine.client.last_payload.clear()  # The fake client's per-topic record, not scheduler state
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return {
+        "jobs": count,
+        "bytes_per_job": round(retained / count, 1),
+        "bytes_per_job_before_firing": round(scheduled / count, 1),
+        "total_mb": round(retained / 2 ** 20, 1),
+    }
+
+
+# =================================================================
+# --- RUNNER ---
+# =================================================================
+
+def compare(previous, current, path=""):
+    """Prints every numeric result next to its value from an earlier run."""
+    for key, value in current.items():
+        label = f"{path}.{key}" if path else key
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            compare(old or {}, value, label)
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            change = (value - old) / old * 100
+            print(f"  {label:<55} {old:>14} -> {value:<14} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline MQTT scheduler benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Use small sizes for a fast run")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    if args.quick:
+        plan = {"submit": 2000, "dup_sizes": [10000], "drift": (500, 0.05, 2), "list": 10000, "startup": 10000,
+                "memory": 10000, "burst": (2000, [1, 4], 20000), "reload": (10000, 1000),
+                "ingest": 2000, "mqtt5": (100, 50, [10, 1000]), "host": (10, 1000, 0.5, 2),
+                "events": 20000, "simulate": 10000}
+    else:
+        plan = {"submit": 20000, "dup_sizes": [10000, 100000, 1000000], "drift": (5000, 0.1, 5),
+                "list": 100000, "startup": 100000, "memory": 1000000, "burst": (20000, [1, 4, 8], 50000),
+                "reload": (100000, 5000), "ingest": 20000,
+                "mqtt5": (1000, 100, [10, 100, 65535]), "host": (20, 5000, 1, 5),
+                "events": 200000, "simulate": 100000}
+
+    benchmarks = [
+        ("submission_throughput", lambda: bench_submission_throughput(plan["submit"])),
+        ("duplicate_check", lambda: bench_duplicate_check(plan["dup_sizes"])),
+        ("fire_drift", lambda: bench_fire_drift(*plan["drift"])),
+        ("list_jobs_latency", lambda: bench_list_latency(plan["list"])),
+        ("ingest", lambda: bench_ingest(plan["ingest"])),
+        ("startup", lambda: bench_startup(plan["startup"])),
+        ("engine_host", lambda: bench_engine_host(*plan["host"])),
+        ("memory_per_job", lambda: bench_memory_per_job(plan["memory"])),
+        ("event_log", lambda: bench_event_log(plan["events"])),
+        ("simulation", lambda: bench_simulation(plan["simulate"])),
+        ("burst_drain", lambda: bench_burst_drain(*plan["burst"])),
+        ("mqtt5_wire_bytes", lambda: bench_mqtt5_wire_bytes(*plan["mqtt5"])),
+        ("hot_reload", lambda: bench_hot_reload(*plan["reload"])),
+    ]
+
+    results = {}
+    output_path = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Persistence writes relative paths, so run everything inside a scratch directory
+    with tempfile.TemporaryDirectory() as scratch:
+        previous_dir = os.getcwd()
+        os.chdir(scratch)
+        try:
+            for name, run in benchmarks:
+                print(f"Running {name}...", flush=True)
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    results[name] = run()
+                    event_log.WRITER.flush(timeout=60)  # Queued log lines still belong in devnull
+                print(f"  {json.dumps(results[name])}")
+        finally:
+            os.chdir(previous_dir)
+
+    document = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if compare_path:
+        with open(compare_path) as f:
+            previous = json.load(f)
+        print(f"\nComparison with {compare_path} ({previous.get('timestamp', 'unknown time')}):")
+        compare(previous.get("results", {}), results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
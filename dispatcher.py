@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import json
+import os
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+INFLIGHT_POLL_INTERVAL = 0.01  # seconds between ack checks while the in-flight window is full
+
+
+class PublishDispatcher:
+    """
+    Bounded publish queue for the asyncio runtime.
+
+    Firing a job only enqueues its message; a dedicated publisher coroutine drains the
+    queue. QoS 1/2 publishes hold an in-flight slot until the broker acknowledges them,
+    so a slow broker throttles the publisher instead of the timer loop. When the queue
+    is full the overflow policy decides what happens:
+
+    - "block":       the timer loop waits for space before firing more jobs
+    - "drop_oldest": the oldest queued message is discarded to make room
+    - "spill":       the message is appended to a spill file and re-queued once there is room;
+                     until the file is drained, new messages are spilled behind it to keep their order
+
+    An optional RateLimiter paces the publisher, and an optional BurstTracker times how
+    long each burst of queued messages takes to drain.
+    """
+
+    def __init__(self, publish_fn, maxsize=10000, max_inflight=100, overflow="block",
+                 spill_file="dispatch_spill.jsonl", limiter=None, bursts=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+
+        self._publish_fn = publish_fn  # publish_fn(topic, payload, qos, retain) -> MQTTMessageInfo or None
+        self.maxsize = maxsize
+        self.max_inflight = max_inflight
+        self.overflow = overflow
+        self.spill_file = spill_file
+        self._limiter = limiter
+        self._bursts = bursts
+
+        self._queue = collections.deque()
+        self._has_items = None
+        self._has_space = None
+        self._inflight = []  # MQTTMessageInfo of QoS 1/2 publishes the broker hasn't acknowledged yet
+
+        self._spill_offset = 0  # Bytes of the spill file already moved back into the queue
+
+        self.published = 0
+        self.dropped = 0
+        self.spilled = 0  # Messages in the spill file that are not back in the queue yet
+
+    def attach(self):
+        """
+        Creates the loop-bound events. Call with the publisher's event loop set as current.
+        Messages spilled by a previous run that never got published are queued ahead of new ones.
+        """
+        self._has_items = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        if self.overflow == "spill" and os.path.exists(self.spill_file):
+            try:
+                with open(self.spill_file, 'rb') as f:
+                    self.spilled = sum(1 for line in f if line.strip())
+                self._spill_offset = 0
+            except IOError as e:
+                print(f"[DISPATCH ERROR] Could not read {self.spill_file}: {e}")
+            if self.spilled:
+                print(f"[DISPATCH] Found {self.spilled} spilled message(s) from a previous run; publishing them first.")
+
+    @property
+    def depth(self):
+        """Messages waiting in memory (not counting spilled ones)."""
+        return len(self._queue)
+
+    @property
+    def inflight(self):
+        """QoS 1/2 messages sent but not yet acknowledged by the broker."""
+        return len(self._inflight)
+
+    # -----------------------------------------------------------------
+    # Producer side (runs on the event loop thread)
+    # -----------------------------------------------------------------
+
+    def submit(self, topic, payload, qos=0, retain=False):
+        """Queues a message for publishing without waiting for the broker."""
+        message = (topic, payload, qos, retain)
+
+        if self.overflow == "spill" and self.spilled:
+            # Older messages are still in the spill file; queueing this one would publish it ahead of them
+            self._spill(message)
+            self._has_items.set()  # Wakes the publisher in case reading the spill file failed earlier
+            return
+        if len(self._queue) >= self.maxsize:
+            if self.overflow == "drop_oldest":
+                self._queue.popleft()
+                self.dropped += 1
+                if self._bursts is not None:
+                    self._bursts.done()
+            elif self.overflow == "spill":
+                self._spill(message)
+                return
+            # "block" keeps the message; wait_for_space() holds the timer loop until we drain
+
+        self._queue.append(message)
+        if self._bursts is not None:
+            self._bursts.queued()
+        self._has_items.set()
+        if len(self._queue) >= self.maxsize:
+            self._has_space.clear()
+
+    async def wait_for_space(self):
+        """Used as the timer loop's before-fire hook so "block" applies backpressure to firing."""
+        if self.overflow == "block":
+            await self._has_space.wait()
+
+    def _spill(self, message):
+        try:
+            with open(self.spill_file, 'a') as f:
+                f.write(json.dumps(message, separators=(",", ":")) + "\n")
+            self.spilled += 1
+        except IOError as e:
+            self.dropped += 1
+            print(f"[DISPATCH ERROR] Could not spill message to {self.spill_file}: {e}")
+
+    def _unspill(self):
+        """Moves spilled messages back into the queue, up to its free space, once it has drained."""
+        if self.spilled == 0:
+            return
+        room = self.maxsize - len(self._queue)
+        try:
+            with open(self.spill_file, 'rb') as f:
+                f.seek(self._spill_offset)
+                while room > 0:
+                    line = f.readline()
+                    if not line:
+                        self.spilled = 0  # The count was off (e.g. a torn last line); the file is drained
+                        break
+                    self._spill_offset = f.tell()
+                    if not line.strip():
+                        continue
+                    self.spilled -= 1
+                    try:
+                        self._queue.append(tuple(json.loads(line)))
+                    except ValueError as e:
+                        self.dropped += 1
+                        print(f"[DISPATCH ERROR] Skipping unreadable spilled message: {e}")
+                        continue
+                    room -= 1
+                    if self._bursts is not None:
+                        self._bursts.queued()
+            if self.spilled == 0:
+                os.remove(self.spill_file)
+                self._spill_offset = 0
+        except FileNotFoundError:
+            print(f"[DISPATCH ERROR] {self.spill_file} disappeared; {self.spilled} spilled message(s) lost.")
+            self.dropped += self.spilled
+            self.spilled = 0
+            self._spill_offset = 0
+        except IOError as e:
+            print(f"[DISPATCH ERROR] Could not reload spilled messages: {e}")
+        if len(self._queue) >= self.maxsize:
+            self._has_space.clear()
+
+    async def _wait_for_inflight_slot(self):
+        """Waits until fewer than max_inflight QoS 1/2 messages are unacknowledged."""
+        while True:
+            self._inflight = [info for info in self._inflight if not info.is_published()]
+            if len(self._inflight) < self.max_inflight:
+                return
+            await asyncio.sleep(INFLIGHT_POLL_INTERVAL)
+
+    # -----------------------------------------------------------------
+    # Publisher coroutine
+    # -----------------------------------------------------------------
+
+    async def run(self):
+        """Drains the queue forever, respecting the in-flight limit for QoS 1/2 messages."""
+        while True:
+            if not self._queue:
+                self._unspill()
+            if not self._queue:
+                self._has_items.clear()
+                await self._has_items.wait()
+                continue
+
+            topic, payload, qos, retain = self._queue.popleft()
+            if len(self._queue) < self.maxsize:
+                self._has_space.set()
+
+            if self._limiter:
+                delay = self._limiter.reserve(topic)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if qos > 0:
+                await self._wait_for_inflight_slot()
+
+            try:
+                info = self._publish_fn(topic, payload, qos, retain)
+            except Exception as e:
+                # paho rejects e.g. wildcard topics by raising; one bad message must not stop the publisher
+                print(f"[DISPATCH ERROR] Could not publish to {topic!r}: {e}")
+                info = None
+                self.dropped += 1
+            if info is not None and info.rc == 0:
+                self.published += 1
+                if qos > 0:
+                    self._inflight.append(info)
+            if self._bursts is not None:
+                self._bursts.done()
+
+            # Let timers and inbound messages run between publishes
+            await asyncio.sleep(0)
@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import os
+import threading
+
+from timer_engine import TimerEngine
+from scheduler_engine import SchedulerEngine
+
+RECONNECT_MIN_DELAY = 1    # Seconds before the first reconnect attempt after a connection is lost
+RECONNECT_MAX_DELAY = 60   # Upper bound for the doubling reconnect delay
+ENGINE_FILES = ("schedule_file", "journal_file", "outbox_file")  # Settings no two engines may share
+
+
+class _Connection:
+    """A client the host does socket I/O for."""
+
+    def __init__(self, client):
+        self.client = client
+        self.fd = None              # Socket file descriptor registered with the event loop
+        self.connecting = False     # A connect/reconnect is running in the executor
+        self.retry_at = 0.0         # Loop time of the next reconnect attempt
+        self.delay = RECONNECT_MIN_DELAY
+        self.closed = False         # disconnect() was called; never reconnect
+
+
+class EngineHost:
+    """
+    Runs many SchedulerEngines in one process on a shared timer and a shared I/O loop.
+
+    Every engine registers its jobs with the host's TimerEngine, so one thread sleeps
+    until the next deadline across all engines. Broker connections don't get a network
+    thread each: their sockets are registered with one asyncio loop, which reads and
+    writes for every client and handles keepalives and reconnects.
+
+        host = EngineHost()
+        host.add(SchedulerConfig(broker_address="10.0.0.5", schedule_file="a.json", ...))
+        host.add(SchedulerConfig(broker_address="10.0.0.6", schedule_file="b.json", ...))
+        host.run_forever()
+    """
+
+    def __init__(self):
+        self.timers = TimerEngine()
+        self.engines = []
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = None
+        self._timer_thread = None
+        self._connections = {}   # client -> _Connection
+        self._maintain_task = None
+
+    def add(self, config, name=None):
+        """Creates an engine for `config` on this host. Raises ValueError if it would share a file with another engine."""
+        if config.runtime_mode != "threaded":
+            raise ValueError("Engines on a shared host must use the threaded runtime mode")
+        # Two engines on one journal would each restore the other's jobs and fire them on the wrong broker
+        for setting in ENGINE_FILES:
+            path = os.path.abspath(getattr(config, setting))
+            for other in self.engines:
+                if os.path.abspath(getattr(other.config, setting)) == path:
+                    raise ValueError(f"{setting} {getattr(config, setting)!r} is already used by engine {other.name!r}; "
+                                     f"every engine needs its own {', '.join(ENGINE_FILES)}")
+        engine = SchedulerEngine(config, timers=self.timers, name=name)
+        self.engines.append(engine)
+        return engine
+
+    # -----------------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------------
+
+    def start(self):
+        """Starts the I/O loop, every engine and the shared timer thread. Does not block."""
+        self._start_engines()
+        self._timer_thread = threading.Thread(target=self.timers.run_forever, name="engine-host-timers", daemon=True)
+        self._timer_thread.start()
+
+    def run_forever(self):
+        """Starts the host and blocks, firing every engine's jobs on the calling thread, until Ctrl+C."""
+        try:
+            self._start_engines()
+            self.timers.run_forever()
+        except KeyboardInterrupt:
+            print("\nStopping scheduler host...")
+        finally:
+            self.stop()
+
+    def stop(self, timeout=2.0):
+        """Stops every engine, lets their DISCONNECT packets go out and shuts the loop down."""
+        for engine in self.engines:
+            engine.stop()
+        self.timers.stop()
+        if self._loop_thread is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(timeout), self._loop).result(timeout + 1)
+        except Exception as e:
+            print(f"[HOST] Connections did not close cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join(timeout)
+        self._loop_thread = None
+
+    def _start_engines(self):
+        self._loop_thread = threading.Thread(target=self._run_loop, name="engine-host-io", daemon=True)
+        self._loop_thread.start()
+        for engine in self.engines:
+            engine.start(network=self, run_timers=False)
+        print(f"[HOST] Running {len(self.engines)} engine(s) on one timer and I/O loop.")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._maintain_task = self._loop.create_task(self._maintain())
+        self._loop.run_forever()
+        # stop() was called: let the maintenance task finish cancelling before the loop is closed
+        self._maintain_task.cancel()
+        self._loop.run_until_complete(asyncio.gather(self._maintain_task, return_exceptions=True))
+        self._loop.close()
+
+    # -----------------------------------------------------------------
+    # Network, called by SchedulerEngine
+    # -----------------------------------------------------------------
+
+    def connect(self, client, host, port, keepalive):
+        """Connects `client` in the background and does its socket I/O on the host loop from then on."""
+        connection = _Connection(client)
+        self._connections[client] = connection
+        client.on_socket_open = lambda c, userdata, sock: self._on_loop(self._add_socket, connection, sock.fileno())
+        client.on_socket_close = lambda c, userdata, sock: self._on_loop(self._remove_socket, connection)
+        client.on_socket_register_write = lambda c, userdata, sock: self._on_loop(self._watch_writes, connection, True)
+        client.on_socket_unregister_write = lambda c, userdata, sock: self._on_loop(self._watch_writes, connection, False)
+        self._on_loop(self._start_connect, connection, lambda: client.connect(host, port, keepalive))
+
+    def disconnect(self, client):
+        """Sends DISCONNECT and stops reconnecting `client`. Called by SchedulerEngine.stop()."""
+        connection = self._connections.get(client)
+        if connection is None:
+            return
+        connection.closed = True
+        client.disconnect()
+
+    def _on_loop(self, fn, *args):
+        # paho calls the socket callbacks from whichever thread publishes. Everything is queued,
+        # even from the loop thread, so a socket's close is always handled before a reused fd's open.
+        self._loop.call_soon_threadsafe(fn, *args)
+
+    def _add_socket(self, connection, fd):
+        connection.fd = fd
+        self._loop.add_reader(fd, connection.client.loop_read)
+
+    def _remove_socket(self, connection):
+        if connection.fd is not None:
+            with contextlib.suppress(OSError):
+                self._loop.remove_writer(connection.fd)
+            with contextlib.suppress(OSError):
+                self._loop.remove_reader(connection.fd)
+            connection.fd = None
+
+    def _watch_writes(self, connection, enabled):
+        if connection.fd is None:
+            return
+        # paho closes a socket right after queuing its deregistration, so the fd may already be
+        # closed here. The selector drops the fd even when that raises, and the kernel forgets it too.
+        with contextlib.suppress(OSError):
+            if enabled:
+                self._loop.add_writer(connection.fd, connection.client.loop_write)
+            else:
+                self._loop.remove_writer(connection.fd)
+
+    def _start_connect(self, connection, connect_fn):
+        """Runs a (blocking) connect or reconnect in the executor, backing off after each failure."""
+        if connection.closed or connection.connecting:
+            return
+        connection.connecting = True
+
+        def finished(future):
+            connection.connecting = False
+            error = future.exception()
+            if error is None:
+                connection.delay = RECONNECT_MIN_DELAY
+                return
+            print(f"[HOST] Could not connect, retrying in {connection.delay}s: {error}")
+            connection.retry_at = self._loop.time() + connection.delay
+            connection.delay = min(connection.delay * 2, RECONNECT_MAX_DELAY)
+
+        self._loop.run_in_executor(None, connect_fn).add_done_callback(finished)
+
+    async def _maintain(self):
+        """Keepalives for every connection once a second, and reconnects for the ones that dropped."""
+        while True:
+            await asyncio.sleep(1)
+            for connection in list(self._connections.values()):
+                client = connection.client
+                if client.socket() is not None:
+                    client.loop_misc()
+                elif not connection.closed and not connection.connecting and self._loop.time() >= connection.retry_at:
+                    self._start_connect(connection, client.reconnect)
+
+    async def _drain(self, timeout):
+        """Waits until the closed connections' sockets are gone, so their DISCONNECT packets were sent."""
+        deadline = self._loop.time() + timeout
+        while self._loop.time() < deadline:
+            if all(c.fd is None for c in self._connections.values() if c.closed):
+                return
+            await asyncio.sleep(0.01)
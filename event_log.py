@@ -0,0 +1,213 @@
+import collections
+import itertools
+import json
+import sys
+import threading
+import time
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LEVEL_NAMES = {number: name for name, number in LEVELS.items()}
+
+# Events kept in the ring buffer whatever their level; warnings and errors are always kept too
+RECENT_EVENTS = ("fire", "submit", "cancel", "update", "reload")
+
+WRITER_QUEUE_SIZE = 10000  # Records waiting to be written; beyond this new records are dropped, never waited for
+
+
+class _LogWriter:
+    """
+    The one background thread that formats and writes log records for every EventLog in
+    the process, so engines sharing a process also share a writer.
+    """
+
+    def __init__(self, stream=None, maxsize=WRITER_QUEUE_SIZE):
+        self.stream = stream
+        self.maxsize = maxsize
+        # deque.append/popleft are atomic, so the hot path takes no lock; the event only
+        # wakes the writer when it has gone idle
+        self._records = collections.deque()
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def put(self, record):
+        """Queues a record without blocking. Returns False if the queue is full."""
+        if self._thread is None:
+            self._start()
+        if len(self._records) >= self.maxsize:
+            return False
+        self._records.append(record)
+        if not self._wake.is_set():
+            self._wake.set()
+        return True
+
+    def flush(self, timeout=1.0):
+        """Waits until everything queued so far has been written."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._records.append(done)
+        self._wake.set()
+        done.wait(timeout)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        records = self._records
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            stream = self.stream or sys.stdout
+            while records:
+                record = records.popleft()
+                if isinstance(record, threading.Event):
+                    stream.flush()
+                    record.set()
+                    continue
+                event_log, entry = record
+                try:
+                    stream.write(event_log.format(entry) + "\n")
+                except Exception as e:
+                    sys.stderr.write(f"[EVENT LOG ERROR] Could not write {entry[2]} event: {e}\n")
+            stream.flush()
+
+
+WRITER = _LogWriter()
+
+
+class EventLog:
+    """
+    Structured event log for one engine.
+
+    Logging an event only takes a timestamp and queues a (time, level, event, message,
+    fields) tuple: formatting the message and writing it happens on the shared writer
+    thread, so the timer and network threads never wait on stdout. Events below `level`
+    are not written, and `sample_rates` writes only 1 in N of a high-rate event such as
+    {"publish": 100}; warnings and errors are never sampled. If the writer falls behind,
+    records are dropped and counted rather than blocking.
+
+    Recent fire/submit/cancel/update/reload events and every warning or error are also
+    kept in a ring buffer of `recent_size` entries, whatever the level, and can be read
+    back with recent().
+    """
+
+    def __init__(self, level="info", output="text", sample_rates=None, recent_size=1000,
+                 recent_events=RECENT_EVENTS, source=None, writer=WRITER):
+        if level not in LEVELS:
+            raise ValueError(f"Unknown log level {level!r}")
+        if output not in ("text", "json"):
+            raise ValueError(f"Unknown log format {output!r}")
+        self.level = LEVELS[level]
+        self.output = output
+        self.source = source  # Shown on every line when several engines share a process
+        self._sample_counters = {event: (itertools.count(), int(rate)) for event, rate in (sample_rates or {}).items()
+                                 if int(rate) > 1}
+        self._recent = collections.deque(maxlen=recent_size)
+        self._recent_events = frozenset(recent_events)
+        self._writer = writer
+
+        self.sampled_out = 0
+        self.dropped = 0
+
+    # -----------------------------------------------------------------
+    # Logging (hot path)
+    # -----------------------------------------------------------------
+
+    def log(self, level, event, message, fields):
+        """`message` is a str.format template filled from `fields` when the record is written."""
+        keep = event in self._recent_events or level >= LEVELS["warning"]
+        if level < self.level and not keep:
+            return
+        entry = (time.time(), level, event, message, fields)
+        if keep:
+            self._recent.append(entry)  # deque.append is atomic, so no lock is needed
+        if level < self.level:
+            return
+
+        sampling = self._sample_counters.get(event)
+        if sampling is not None and level < LEVELS["warning"]:
+            counter, rate = sampling
+            if next(counter) % rate:
+                self.sampled_out += 1
+                return
+        if not self._writer.put((self, entry)):
+            self.dropped += 1
+
+    def debug(self, event, message, **fields):
+        self.log(10, event, message, fields)
+
+    def info(self, event, message, **fields):
+        self.log(20, event, message, fields)
+
+    def warning(self, event, message, **fields):
+        self.log(30, event, message, fields)
+
+    def error(self, event, message, **fields):
+        self.log(40, event, message, fields)
+
+    def flush(self, timeout=1.0):
+        self._writer.flush(timeout)
+
+    # -----------------------------------------------------------------
+    # Formatting (writer thread)
+    # -----------------------------------------------------------------
+
+    @staticmethod
+    def _render(message, fields):
+        try:
+            return message.format(**fields)
+        except (KeyError, IndexError, ValueError):
+            return message
+
+    def format(self, entry):
+        """One output line for an entry: the usual "[timestamp] message" text, or a JSON object."""
+        timestamp, level, event, message, fields = entry
+        text = self._render(message, fields)
+        if self.output == "json":
+            # Fields come first so a field can never overwrite the record's own keys
+            document = dict(fields)
+            document.update(time=round(timestamp, 3), level=LEVEL_NAMES[level], event=event)
+            if self.source is not None:
+                document["source"] = self.source
+            document["message"] = text
+            return json.dumps(document, default=str, separators=(",", ":"))
+        prefix = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        if self.source is not None:
+            return f"[{prefix}] [{self.source}] {text}"
+        return f"[{prefix}] {text}"
+
+    # -----------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------
+
+    def recent(self, limit=100, event=None, level=None, since=None, job_id=None):
+        """
+        The newest `limit` entries from the ring buffer, oldest first, as dicts. Filters:
+        event name, minimum level name, `since` (epoch seconds) and job_id.
+        """
+        min_level = LEVELS.get(level, 0)
+        matches = []
+        for timestamp, entry_level, name, message, fields in reversed(list(self._recent)):
+            if len(matches) >= limit or (since is not None and timestamp <= since):
+                break
+            if entry_level < min_level or (event is not None and name != event):
+                continue
+            if job_id is not None and fields.get("job_id") != job_id:
+                continue
+            matches.append({
+                **{key: value for key, value in fields.items() if isinstance(value, (str, int, float, bool, type(None)))},
+                "time": round(timestamp, 3),
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                "level": LEVEL_NAMES[entry_level],
+                "event": name,
+                "message": self._render(message, fields),
+            })
+        matches.reverse()
+        return matches
+
+    def stats(self):
+        return {"recent": len(self._recent), "sampled_out": self.sampled_out, "dropped": self.dropped}
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+
+
+class MutationWorker:
+    """
+    Applies inbound job mutations on a single thread that owns the job store.
+
+    paho's network thread only validates a message and queues it with submit(), so a
+    slow disk or a burst of submissions never delays pings or keepalives. The worker
+    applies whatever arrives within `commit_delay` seconds (up to `max_batch` changes),
+    persists them with one group commit, and only then publishes the replies queued with
+    defer(), in order. If the commit fails, every ack of that batch becomes an error reply.
+    """
+
+    def __init__(self, commit_fn, reply_fn, maxsize=10000, commit_delay=0.02, max_batch=1000,
+                 lock=None, on_latency=None):
+        self._commit_fn = commit_fn    # commit_fn() -> True once queued journal records are durable
+        self._reply_fn = reply_fn      # reply_fn(reply_dict) publishes an ack or error
+        self._lock = lock              # Held while each change is applied (the timer thread shares the store)
+        self._on_latency = on_latency  # on_latency(seconds) gets each message's wait in the queue
+        self.commit_delay = commit_delay
+        self.max_batch = max_batch
+        # A full queue blocks the network thread, which pushes back on the broker instead of growing memory
+        self._queue = queue.Queue(maxsize)
+        self._acks = []
+        self._thread = None
+
+        self.applied = 0
+        self.commits = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mutation-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Applies and commits everything already queued, then stops the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, apply_fn, command):
+        """Queues `apply_fn(command)` to run on the worker."""
+        self._queue.put((time.monotonic(), apply_fn, command))
+
+    def request_commit(self):
+        """
+        Asks for a group commit of journal records queued from another thread (e.g. the timer
+        thread). It never blocks: when the queue is full the worker already has a batch to
+        apply, and the group commit after that batch covers these records too.
+        """
+        if not self.in_worker():
+            try:
+                self._queue.put_nowait((time.monotonic(), None, None))
+            except queue.Full:
+                pass
+
+    def in_worker(self):
+        return threading.current_thread() is self._thread
+
+    def defer(self, reply):
+        """Publishes `reply` after the next group commit. Only call this on the worker thread."""
+        self._acks.append(reply)
+
+    def _apply(self, item):
+        queued_at, apply_fn, command = item
+        if self._on_latency is not None:
+            self._on_latency(time.monotonic() - queued_at)
+        if apply_fn is None:
+            return
+        try:
+            if self._lock is not None:
+                with self._lock:
+                    apply_fn(command)
+            else:
+                apply_fn(command)
+        except Exception as e:
+            print(f"[INGEST ERROR] Could not apply change: {e}")
+        self.applied += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            # Debounce: keep applying what arrives within commit_delay, then commit once
+            batch_deadline = time.monotonic() + self.commit_delay
+            batch = 0
+            while True:
+                self._apply(item)
+                batch += 1
+                if batch >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, batch_deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+            self._flush()
+
+    def _flush(self):
+        durable = self._commit_fn()
+        self.commits += 1
+        acks, self._acks = self._acks, []
+        for reply in acks:
+            if not durable and reply.get("status") != "error":
+                reply = {"status": "error", "message": "Change was applied but could not be saved",
+                         "job_id": reply.get("job_id")}
+            try:
+                self._reply_fn(reply)
+            except Exception as e:
+                print(f"[INGEST ERROR] Could not publish reply: {e}")
@@ -0,0 +1,223 @@
+import collections
+import hashlib
+import itertools
+import json
+import sys
+import uuid
+
+
+# One shared encoder; json.dumps() with custom separators builds a new one per call
+_encode_key = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def make_job_id(job_data):
+    """
+    Returns a deterministic ID for a job, derived from its (type, topic, payload, time) key.
+    Submitting the same job twice always produces the same ID, which is what makes
+    duplicate detection a single dictionary lookup.
+    """
+    time_value = job_data.get("time")
+    # 300 and 300.0 describe the same interval job
+    if isinstance(time_value, float) and time_value.is_integer():
+        time_value = int(time_value)
+
+    key_fields = [job_data.get("type"), job_data.get("topic"), job_data.get("payload"), time_value]
+    # Fan-out jobs are also keyed by their targets; single-topic job IDs are unchanged
+    if job_data.get("devices") is not None or job_data.get("group") is not None:
+        key_fields += [job_data.get("group"), job_data.get("devices")]
+
+    key = _encode_key(key_fields)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+# Fixed job fields, stored as slots on JobRecord; any other keys go in its `extra` dict
+JOB_FIELDS = ("type", "topic", "payload", "time", "qos")
+
+# Keys a job can't carry: listings put the job's own ID under "id", so a submitted one is dropped
+RESERVED_KEYS = ("id",)
+_NOT_EXTRA = frozenset(JOB_FIELDS + RESERVED_KEYS)
+
+# Mutations remembered for delta sync; clients further behind than this must re-list
+CHANGE_LOG_SIZE = 10000
+
+# Job types are stored as a small int instead of a string per job
+JOB_TYPES = ("daily", "interval", "once")
+_TYPE_CODES = {name: code for code, name in enumerate(JOB_TYPES)}
+
+
+def _interned(value):
+    # Interned strings are shared by every job that uses them and freed once no job does
+    return sys.intern(value) if type(value) is str else value
+
+
+class JobRecord:
+    """
+    Compact in-memory form of one job. String topics, payloads and times are interned,
+    so a million jobs that share values share the string objects.
+    Reads like a read-only mapping (get, [], keys, **) so callers can treat it as job data.
+    """
+
+    __slots__ = ("type_code", "topic", "payload", "time", "qos", "extra", "seq")
+
+    def __init__(self, type_code, topic, payload, time, qos, extra):
+        self.type_code = type_code
+        self.topic = topic
+        self.payload = payload
+        self.time = time
+        self.qos = qos          # None when the job didn't set one (defaults to 0 when publishing)
+        self.extra = extra      # Dict of other keys (e.g. fan-out "devices"/"group"), or None
+        self.seq = 0            # Store version when the job was added; rises in insertion order
+
+    @property
+    def type(self):
+        return JOB_TYPES[self.type_code]
+
+    def keys(self):
+        keys = [key for key in JOB_FIELDS if key == "type" or getattr(self, key) is not None]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def __getitem__(self, key):
+        if key == "type":
+            return self.type
+        if key in JOB_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """The job as a plain dictionary, as submitted and as written to the schedule file."""
+        return {key: self[key] for key in self.keys()}
+
+
+class JobStore:
+    """
+    Hash index of all active jobs, keyed by job ID. Lookup, insert and removal are O(1).
+    Jobs are held as JobRecords; get(), items() and jobs() hand out plain dictionaries.
+
+    Every add or remove bumps `version`. Versions restart with each process, so each
+    store also has a random `epoch`; a version is only meaningful with its epoch.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.removals = 0  # Jobs ever removed; lets a page cursor find its place again
+        self._changes = collections.deque(maxlen=CHANGE_LOG_SIZE)  # (version, job_id, added)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def _make_record(self, job_data):
+        type_code = _TYPE_CODES.get(job_data.get("type"))
+        if type_code is None:
+            raise ValueError(f"Unknown job type {job_data.get('type')!r}, expected one of {JOB_TYPES}")
+        extra = {key: value for key, value in job_data.items() if key not in _NOT_EXTRA} or None
+        return JobRecord(type_code, _interned(job_data.get("topic")), _interned(job_data.get("payload")),
+                         _interned(job_data.get("time")), job_data.get("qos"), extra)
+
+    def record(self, job_id):
+        """The stored JobRecord itself (no copy), or None. For hot paths such as firing a job."""
+        return self._jobs.get(job_id)
+
+    def get(self, job_id):
+        record = self._jobs.get(job_id)
+        return record.to_dict() if record is not None else None
+
+    def add(self, job_data, job_id=None):
+        """
+        Adds a job and returns its ID, or None if an identical job is already stored.
+        `job_id` may be passed when the caller has already computed it with make_job_id().
+        Raises ValueError for an unknown job type.
+        """
+        if job_id is None:
+            job_id = make_job_id(job_data)
+        if job_id in self._jobs:
+            return None
+        record = self._make_record(job_data)
+        self.version += 1
+        record.seq = self.version
+        self._jobs[job_id] = record
+        self._changes.append((self.version, job_id, True))
+        return job_id
+
+    def remove(self, job_id):
+        """Removes a job by ID and returns its data, or None if it was not stored."""
+        record = self._jobs.pop(job_id, None)
+        if record is None:
+            return None
+        self.version += 1
+        self.removals += 1
+        self._changes.append((self.version, job_id, False))
+        return record.to_dict()
+
+    def changes_since(self, version):
+        """
+        Net (added_ids, removed_ids) after `version`, in change order, or None if the change
+        log no longer reaches back that far (or the version is from the future).
+        """
+        if version > self.version or (version < self.version and
+                                      (not self._changes or self._changes[0][0] > version + 1)):
+            return None
+        final = {}
+        # Only the last change to each job matters; walk back from the newest
+        for change_version, job_id, added in reversed(self._changes):
+            if change_version <= version:
+                break
+            final.setdefault(job_id, added)
+        added_ids = [job_id for job_id, added in reversed(final.items()) if added]
+        removed_ids = [job_id for job_id, added in reversed(final.items()) if not added]
+        return added_ids, removed_ids
+
+    def items(self):
+        """(job_id, job_data) pairs in insertion order."""
+        return [(job_id, record.to_dict()) for job_id, record in self._jobs.items()]
+
+    def ids(self):
+        """Live view of every job ID; supports set operations without copying."""
+        return self._jobs.keys()
+
+    def cursor_after(self, position, record):
+        """
+        Page cursor for resuming after `record`, found at insertion-order `position`:
+        "<next position>.<removals so far>.<record's seq>". Unlike a bare position it
+        stays valid when jobs before it are removed between pages.
+        """
+        return f"{position + 1}.{self.removals}.{record.seq}"
+
+    def iter_from(self, cursor):
+        """
+        Iterates (position, job_id, JobRecord) from a cursor made by cursor_after(), or from a
+        plain insertion-order position, without copying the index.
+        """
+        if isinstance(cursor, str) and "." in cursor:
+            position, removals, last_seq = (int(part) for part in cursor.split("."))
+            # Removals since the cursor was made can only have moved the next job towards the front
+            position = max(0, position - max(0, self.removals - removals))
+        else:
+            position, last_seq = int(cursor or 0), 0
+        items = enumerate(itertools.islice(self._jobs.items(), position, None), position)
+        for position, (job_id, record) in items:
+            if record.seq > last_seq:  # Skips jobs the previous pages already covered
+                yield position, job_id, record
+                break
+        for position, (job_id, record) in items:
+            yield position, job_id, record
+
+    def jobs(self):
+        """Job dictionaries in insertion order, as written to the schedule file."""
+        return [record.to_dict() for record in self._jobs.values()]
@@ -1,18 +1,52 @@
 #!/usr/bin/env python3
 """
-List all scheduled jobs from the MQTT scheduler
+List all scheduled jobs from the MQTT scheduler.
+Pages are requested one at a time on a private reply topic and printed as they arrive.
+
+Usage:
+    python list_jobs.py [--prefix esp8266/] [--type daily] [--from 20:00] [--to 23:59] [--page-size 100]
 """
 import paho.mqtt.client as mqtt
+import argparse
 import json
-import time
 import sys
+import threading
+import uuid
 
 BROKER = "broker.hivemq.com"
 PORT = 1883
 LIST_JOBS_TOPIC = "myhome/scheduler/list_jobs"
 STATUS_TOPIC = "myhome/scheduler/status"
+PAGE_TIMEOUT = 5  # seconds to wait for each page
+
+parser = argparse.ArgumentParser(description="List jobs scheduled on the MQTT scheduler")
+parser.add_argument("--prefix", help="Only jobs whose topic starts with this prefix")
+parser.add_argument("--type", choices=["daily", "interval", "once"], help="Only jobs of this type")
+parser.add_argument("--from", dest="time_from", help="Only daily/once jobs at or after this HH:MM")
+parser.add_argument("--to", dest="time_to", help="Only daily/once jobs at or before this HH:MM")
+parser.add_argument("--page-size", type=int, default=100, help="Jobs per page (default 100)")
+args = parser.parse_args()
+
+# Private reply topic so we only see our own pages, not other clients' status traffic
+REPLY_TOPIC = f"{STATUS_TOPIC}/reply/{uuid.uuid4().hex[:12]}"
+
+page_arrived = threading.Event()
+finished = False
+jobs_listed = 0
+
+
+def request_page(client, cursor):
+    request = {"reply_to": REPLY_TOPIC, "limit": args.page_size, "cursor": cursor}
+    if args.prefix:
+        request["topic_prefix"] = args.prefix
+    if args.type:
+        request["type"] = args.type
+    if args.time_from:
+        request["time_from"] = args.time_from
+    if args.time_to:
+        request["time_to"] = args.time_to
+    client.publish(LIST_JOBS_TOPIC, json.dumps(request))
 
-response_received = False
 
 def on_connect(client, userdata, flags, reason_code, properties):
     if reason_code.is_failure:
@@ -20,84 +54,74 @@ def on_connect(client, userdata, flags, reason_code, properties):
         sys.exit(1)
     else:
         print(f"✓ Connected to {BROKER}:{PORT}")
-        
-        # Subscribe to status topic first
-        client.subscribe(STATUS_TOPIC)
-        print(f"✓ Subscribed to {STATUS_TOPIC}")
-        
-        # Wait a moment then request job list
-        time.sleep(0.5)
-        client.publish(LIST_JOBS_TOPIC, "list")
-        print(f"✓ Requested job list from {LIST_JOBS_TOPIC}")
-        print("\nWaiting for response...\n")
+
+        # Subscribe to the private reply topic first
+        client.subscribe(REPLY_TOPIC)
+        print(f"✓ Subscribed to {REPLY_TOPIC}")
+
+def on_subscribe(client, userdata, mid, reason_code_list, properties):
+    # Only request the first page once the broker has confirmed our subscription
+    request_page(client, 0)
+    print(f"✓ Requested job list from {LIST_JOBS_TOPIC}")
+    print("\nWaiting for response...\n")
+    print("="*60)
+    print("📋 SCHEDULED JOBS")
+    print("="*60)
 
 def on_message(client, userdata, msg):
-    global response_received
-    
-    if msg.topic == STATUS_TOPIC:
-        response_received = True
+    global finished, jobs_listed
+
+    if msg.topic == REPLY_TOPIC:
         try:
             data = json.loads(msg.payload.decode('utf-8'))
-            
-            # Check if this is a jobs list response
-            if "jobs" in data:
-                print("="*60)
-                print("📋 SCHEDULED JOBS")
-                print("="*60)
-                print(f"Timestamp:   {data.get('timestamp', 'N/A')}")
-                print(f"Total Jobs:  {data.get('total_jobs', 0)}")
-                print("="*60)
-                
-                jobs = data.get('jobs', [])
-                
-                if not jobs:
-                    print("\n📭 No jobs currently scheduled.\n")
-                else:
-                    print()
-                    for idx, job in enumerate(jobs, 1):
-                        print(f"Job #{idx}:")
-                        print(f"  Type:    {job.get('type', 'N/A')}")
-                        print(f"  Topic:   {job.get('topic', 'N/A')}")
-                        print(f"  Payload: {job.get('payload', 'N/A')}")
-                        print(f"  Time:    {job.get('time', 'N/A')}")
-                        print()
-                
-                print("="*60)
-            else:
-                # This might be a ping response or other status message
-                print("ℹ️  Received status message (not job list):")
-                print(json.dumps(data, indent=2))
-                
         except json.JSONDecodeError:
             print(f"\n⚠️  Received non-JSON response: {msg.payload.decode('utf-8')}")
-        
-        # Disconnect after receiving response
-        client.disconnect()
-
-def on_disconnect(client, userdata, reason_code, properties):
-    if not response_received:
-        print("\n❌ Disconnected without receiving response")
-        print("   Scheduler may be offline or not responding")
-        sys.exit(1)
+            return
+
+        for job in data.get('jobs', []):
+            jobs_listed += 1
+            print(f"Job #{jobs_listed}:  (id {job.get('id', 'N/A')})")
+            print(f"  Type:    {job.get('type', 'N/A')}")
+            print(f"  Topic:   {job.get('topic', 'N/A')}")
+            if 'devices' in job:
+                print(f"  Devices: {len(job['devices'])} ({', '.join(job['devices'][:5])}{', ...' if len(job['devices']) > 5 else ''})")
+            if 'group' in job:
+                print(f"  Group:   {job['group']}")
+            print(f"  Payload: {job.get('payload', 'N/A')}")
+            print(f"  Time:    {job.get('time', 'N/A')}")
+            print()
+
+        next_cursor = data.get('next_cursor')
+        if next_cursor is None:
+            print("="*60)
+            print(f"Timestamp:   {data.get('timestamp', 'N/A')}")
+            print(f"Listed:      {jobs_listed} of {data.get('total_jobs', 0)} job(s)")
+            print("="*60)
+            if jobs_listed == 0:
+                print("\n📭 No matching jobs currently scheduled.\n")
+            finished = True
+        else:
+            request_page(client, next_cursor)
+        page_arrived.set()
 
 # Create client
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 client.on_connect = on_connect
+client.on_subscribe = on_subscribe
 client.on_message = on_message
-client.on_disconnect = on_disconnect
 
-# Set timeout
 print(f"Connecting to {BROKER}:{PORT}...")
 client.connect(BROKER, PORT, 60)
-
-# Run for max 5 seconds
 client.loop_start()
-time.sleep(5)
 
-if not response_received:
-    print("\n⏱️  Timeout: No response received within 5 seconds")
-    print("   Scheduler is likely OFFLINE or not connected")
-    client.loop_stop()
-    sys.exit(1)
+# Keep going as long as pages keep arriving; give up if one takes longer than PAGE_TIMEOUT
+while not finished:
+    if not page_arrived.wait(PAGE_TIMEOUT):
+        print(f"\n⏱️  Timeout: No response received within {PAGE_TIMEOUT} seconds")
+        print("   Scheduler is likely OFFLINE or not connected")
+        client.loop_stop()
+        sys.exit(1)
+    page_arrived.clear()
 
+client.disconnect()
 client.loop_stop()
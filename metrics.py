@@ -0,0 +1,241 @@
+import heapq
+import threading
+import time
+
+# Histogram bucket upper bounds in milliseconds; anything slower lands in the overflow bucket
+BUCKET_BOUNDS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+WORST_JOBS_REPORTED = 5
+# Jobs with per-job drift stats. Only the worst are kept, so metrics don't grow with the job count;
+# the spare entries keep the list full when a reported job is removed.
+WORST_JOBS_TRACKED = 4 * WORST_JOBS_REPORTED
+BURST_MIN_MESSAGES = 10  # Smaller bursts are ordinary traffic and are not timed
+
+
+class Histogram:
+    """Fixed-bucket latency histogram. Percentiles are reported as the upper bound of the bucket they fall in."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        value_ms = max(0.0, value_ms)
+        index = 0
+        while index < len(BUCKET_BOUNDS_MS) and value_ms > BUCKET_BOUNDS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0.0
+        threshold = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                # Never report more than the slowest value actually seen
+                bound = BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.max
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 3),
+        }
+
+
+class Metrics:
+    """
+    Process-wide scheduler metrics. Histograms and rates cover the current reporting
+    window and are reset by report(). Per-job drift stats are only kept for the
+    WORST_JOBS_TRACKED jobs with the largest drift, until a job is removed or a worse
+    one replaces it; a job's fire count starts when it enters that list.
+    Safe to call from the timer thread, paho's network thread and the event loop.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._job_stats = {}   # job_id -> [fires, max_drift_ms], for at most WORST_JOBS_TRACKED jobs
+        self.last_report = None
+        self.last_reload = None  # Summary of the most recent schedule file hot reload
+        self._drift_floor = 0.0  # Least max drift among the tracked jobs once the list is full
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = self._clock()
+        self.fire_drift = Histogram()
+        self.publish_latency = Histogram()
+        self.commit_time = Histogram()
+        self.loop_lag = Histogram()
+        self.burst_drain = Histogram()
+        self.ingest_latency = Histogram()
+        self.largest_burst = None  # (messages, drain_ms) of the biggest burst in this window
+        self.fires = 0
+        self.publishes = 0
+        self.submissions = 0
+
+    # -----------------------------------------------------------------
+    # Recording
+    # -----------------------------------------------------------------
+
+    def record_fire(self, job_id, drift_seconds):
+        """A job fired `drift_seconds` after its scheduled deadline."""
+        drift_ms = drift_seconds * 1000
+        with self._lock:
+            self.fire_drift.observe(drift_ms)
+            self.fires += 1
+            stats = self._job_stats.get(job_id)
+            if stats is not None:
+                stats[0] += 1
+                if drift_ms > stats[1]:
+                    stats[1] = drift_ms
+            elif len(self._job_stats) < WORST_JOBS_TRACKED:
+                self._job_stats[job_id] = [1, drift_ms]
+            elif drift_ms > self._drift_floor:
+                self._replace_best_tracked(job_id, drift_ms)
+
+    def _replace_best_tracked(self, job_id, drift_ms):
+        """Swaps the tracked job with the least drift for a worse one. Caller holds the lock."""
+        best = min(self._job_stats, key=lambda tracked: self._job_stats[tracked][1])
+        self._drift_floor = self._job_stats[best][1]
+        if drift_ms <= self._drift_floor:
+            return  # The floor was stale: every tracked job has drifted further since
+        del self._job_stats[best]
+        self._job_stats[job_id] = [1, drift_ms]
+        self._drift_floor = min(stats[1] for stats in self._job_stats.values())
+
+    def record_loop_lag(self, lag_seconds):
+        """An internal timer (not a job) woke `lag_seconds` late."""
+        with self._lock:
+            self.loop_lag.observe(lag_seconds * 1000)
+
+    def record_publish(self, elapsed_seconds):
+        with self._lock:
+            self.publish_latency.observe(elapsed_seconds * 1000)
+            self.publishes += 1
+
+    def record_commit(self, elapsed_seconds):
+        with self._lock:
+            self.commit_time.observe(elapsed_seconds * 1000)
+
+    def record_ingest(self, queued_seconds):
+        """A job change waited `queued_seconds` for the mutation worker."""
+        with self._lock:
+            self.ingest_latency.observe(queued_seconds * 1000)
+
+    def record_burst(self, messages, drain_seconds):
+        """A burst of `messages` queued publishes took `drain_seconds` to publish."""
+        drain_ms = drain_seconds * 1000
+        with self._lock:
+            self.burst_drain.observe(drain_ms)
+            if self.largest_burst is None or messages > self.largest_burst[0]:
+                self.largest_burst = (messages, drain_ms)
+
+    def record_reload(self, summary):
+        """A hot reload of the schedule file finished; `summary` has its diff size and timings."""
+        with self._lock:
+            self.last_reload = summary
+
+    def record_submissions(self, count=1):
+        with self._lock:
+            self.submissions += count
+
+    def forget_job(self, job_id):
+        with self._lock:
+            self._job_stats.pop(job_id, None)
+
+    # -----------------------------------------------------------------
+    # Reporting
+    # -----------------------------------------------------------------
+
+    def report(self, queue_depth=None):
+        """Returns the metrics for the window that just ended and starts a new window."""
+        with self._lock:
+            elapsed = max(self._clock() - self._window_start, 1e-9)
+            worst = heapq.nlargest(WORST_JOBS_REPORTED, self._job_stats.items(), key=lambda item: item[1][1])
+
+            report = {
+                "window_seconds": round(elapsed, 3),
+                "fire_drift_ms": self.fire_drift.summary(),
+                "publish_latency_ms": self.publish_latency.summary(),
+                "commit_time_ms": self.commit_time.summary(),
+                "loop_lag_ms": self.loop_lag.summary(),
+                "burst_drain_ms": self.burst_drain.summary(),
+                "ingest_latency_ms": self.ingest_latency.summary(),
+                "largest_burst": None if self.largest_burst is None else {
+                    "messages": self.largest_burst[0], "drain_ms": round(self.largest_burst[1], 3)},
+                "fires_per_second": round(self.fires / elapsed, 3),
+                "publishes_per_second": round(self.publishes / elapsed, 3),
+                "submissions_per_second": round(self.submissions / elapsed, 3),
+                "dispatch_queue_depth": queue_depth,
+                "last_reload": self.last_reload,
+                "worst_jobs": [
+                    {"job_id": job_id, "fires": fires, "max_drift_ms": round(max_drift, 3)}
+                    for job_id, (fires, max_drift) in worst
+                ],
+            }
+            self._reset_window()
+            self.last_report = report
+        return report
+
+    def summary(self):
+        """Short form for the pong reply, taken from the last completed window."""
+        report = self.last_report
+        if report is None:
+            return None
+        return {
+            "fire_drift_p99_ms": report["fire_drift_ms"]["p99"],
+            "publish_latency_p99_ms": report["publish_latency_ms"]["p99"],
+            "loop_lag_max_ms": report["loop_lag_ms"]["max"],
+            "burst_drain_max_ms": report["burst_drain_ms"]["max"],
+            "ingest_latency_p99_ms": report["ingest_latency_ms"]["p99"],
+            "fires_per_second": report["fires_per_second"],
+            "dispatch_queue_depth": report["dispatch_queue_depth"],
+        }
+
+
+class BurstTracker:
+    """
+    Times how long bursts of queued publishes take to drain. A burst starts when a
+    message is queued while nothing is pending and ends when the last pending message
+    has been published (or dropped). Bursts of at least BURST_MIN_MESSAGES are passed
+    to on_burst(messages, drain_seconds).
+    """
+
+    def __init__(self, on_burst, clock=time.monotonic):
+        self._on_burst = on_burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._messages = 0
+        self._started = None
+
+    def queued(self, count=1):
+        with self._lock:
+            if self._pending == 0:
+                self._started = self._clock()
+                self._messages = 0
+            self._pending += count
+            self._messages += count
+
+    def done(self, count=1):
+        with self._lock:
+            self._pending = max(0, self._pending - count)
+            if self._pending or self._started is None:
+                return
+            messages, elapsed = self._messages, self._clock() - self._started
+            self._started = None
+        if messages >= BURST_MIN_MESSAGES:
+            self._on_burst(messages, elapsed)
@@ -2,41 +2,124 @@
 """
 MQTT Scheduler Continuous Monitor
 Continuously monitors the scheduler health by sending periodic pings.
+Also follows the metrics topic and alerts when the p99 fire drift is too high.
+
+Each ping carries a correlation ID and asks for the pong on a private reply topic.
+The monitor keeps rolling p50/p95/p99 round-trip times and counts missed pongs.
 """
 import paho.mqtt.client as mqtt
+import collections
 import json
+import threading
 import time
+import uuid
 from datetime import datetime
 
 BROKER = "broker.hivemq.com"
 PORT = 1883
 PING_TOPIC = "myhome/scheduler/ping"
 STATUS_TOPIC = "myhome/scheduler/status"
+METRICS_TOPIC = "myhome/scheduler/metrics"
 PING_INTERVAL = 30  # seconds
+DRIFT_ALERT_MS = 1000  # Alert when p99 fire drift exceeds this many milliseconds
+PONG_TIMEOUT = 10  # seconds before an unanswered ping counts as missed
+RTT_WINDOW = 100  # number of recent round trips the percentiles are computed over
+
+REPLY_TOPIC = f"{STATUS_TOPIC}/reply/{uuid.uuid4().hex[:12]}"
+
+# Ping bookkeeping, shared between the main loop and paho's network thread
+probe_lock = threading.Lock()
+pending_pings = {}  # correlation ID -> perf_counter() when sent
+rtt_ms = collections.deque(maxlen=RTT_WINDOW)
+pings_sent = 0
+pongs_missed = 0
 
 def on_connect(client, userdata, flags, reason_code, properties):
     if not reason_code.is_failure:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Connected to broker")
         client.subscribe(STATUS_TOPIC)
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Subscribed to {STATUS_TOPIC}")
+        client.subscribe(METRICS_TOPIC)
+        client.subscribe(REPLY_TOPIC)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Subscribed to {STATUS_TOPIC}, {METRICS_TOPIC} and {REPLY_TOPIC}")
     else:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Failed to connect: {reason_code}")
 
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def rtt_summary():
+    """Rolling RTT percentiles and missed-pong count. Caller holds probe_lock."""
+    if not rtt_ms:
+        return f"RTT n/a, missed {pongs_missed}/{pings_sent}"
+    values = sorted(rtt_ms)
+    return (f"RTT p50/p95/p99: {percentile(values, 0.50):.1f}/{percentile(values, 0.95):.1f}/"
+            f"{percentile(values, 0.99):.1f} ms, missed {pongs_missed}/{pings_sent}")
+
+def send_ping(client):
+    """Sends a correlated ping and counts earlier pings that timed out as missed."""
+    global pings_sent, pongs_missed
+    now = time.perf_counter()
+    correlation_id = uuid.uuid4().hex[:12]
+    with probe_lock:
+        for old_id, sent_at in list(pending_pings.items()):
+            if now - sent_at > PONG_TIMEOUT:
+                del pending_pings[old_id]
+                pongs_missed += 1
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ No pong for ping {old_id} within {PONG_TIMEOUT}s")
+        pending_pings[correlation_id] = now
+        pings_sent += 1
+    client.publish(PING_TOPIC, json.dumps({"id": correlation_id, "reply_to": REPLY_TOPIC}))
+    return correlation_id
+
+def check_drift(timestamp, p99_drift_ms):
+    if p99_drift_ms is not None and p99_drift_ms > DRIFT_ALERT_MS:
+        print(f"[{timestamp}] 🚨 ALERT: p99 fire drift {p99_drift_ms} ms exceeds {DRIFT_ALERT_MS} ms")
+
 def on_message(client, userdata, msg):
-    if msg.topic == STATUS_TOPIC:
+    if msg.topic == METRICS_TOPIC:
         try:
-            status = json.loads(msg.payload.decode('utf-8'))
+            metrics = json.loads(msg.payload.decode('utf-8'))
             timestamp = datetime.now().strftime('%H:%M:%S')
-            
-            if status.get('status') == 'alive':
-                print(f"[{timestamp}] ✅ Scheduler ALIVE - Active Jobs: {status.get('active_jobs', 0)}, Persistent: {status.get('total_persistent_jobs', 0)}")
-            elif status.get('status') == 'online':
-                print(f"[{timestamp}] 🟢 Scheduler ONLINE - Jobs: {status.get('active_jobs', 0)}")
-            else:
-                print(f"[{timestamp}] ⚠️  Scheduler status: {status.get('status', 'unknown')}")
-                
+            drift = metrics.get('fire_drift_ms', {})
+            print(f"[{timestamp}] 📊 Metrics - Fires/s: {metrics.get('fires_per_second', 0)}, "
+                  f"Drift p50/p99/max: {drift.get('p50', 0)}/{drift.get('p99', 0)}/{drift.get('max', 0)} ms, "
+                  f"Queue: {metrics.get('dispatch_queue_depth')}")
+            check_drift(timestamp, drift.get('p99'))
+        except json.JSONDecodeError:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️  Invalid metrics: {msg.payload.decode('utf-8')}")
+
+    elif msg.topic == REPLY_TOPIC:
+        received_at = time.perf_counter()
+        try:
+            status = json.loads(msg.payload.decode('utf-8'))
         except json.JSONDecodeError:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️  Invalid response: {msg.payload.decode('utf-8')}")
+            return
+        with probe_lock:
+            sent_at = pending_pings.pop(status.get('id'), None)
+            if sent_at is None:
+                return  # A pong for a ping we already counted as missed
+            rtt_ms.append((received_at - sent_at) * 1000)
+            summary_line = rtt_summary()
+
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        if status.get('status') == 'alive':
+            print(f"[{timestamp}] ✅ Scheduler ALIVE - Active Jobs: {status.get('active_jobs', 0)}, "
+                  f"Persistent: {status.get('total_persistent_jobs', 0)}, {summary_line}")
+            summary = status.get('metrics') or {}
+            check_drift(timestamp, summary.get('fire_drift_p99_ms'))
+        else:
+            print(f"[{timestamp}] ⚠️  Scheduler status: {status.get('status', 'unknown')}, {summary_line}")
+
+    elif msg.topic == STATUS_TOPIC:
+        # Pongs come back on our reply topic; the shared status topic only announces restarts
+        try:
+            status = json.loads(msg.payload.decode('utf-8'))
+        except json.JSONDecodeError:
+            return
+        if status.get('status') == 'online':
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 🟢 Scheduler ONLINE - Jobs: {status.get('active_jobs', 0)}")
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 client.on_connect = on_connect
@@ -57,12 +140,14 @@ try:
     while True:
         # Send ping
         timestamp = datetime.now().strftime('%H:%M:%S')
-        client.publish(PING_TOPIC, "health-check")
-        print(f"[{timestamp}] 📤 Ping sent...")
+        correlation_id = send_ping(client)
+        print(f"[{timestamp}] 📤 Ping {correlation_id} sent...")
         time.sleep(PING_INTERVAL)
         
 except KeyboardInterrupt:
     print("\n\nStopping monitor...")
+    with probe_lock:
+        print(f"Final {rtt_summary()}")
     client.loop_stop()
     client.disconnect()
     print("Disconnected.")
@@ -0,0 +1,93 @@
+import threading
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+# Bytes an MQTT 5 PUBLISH adds over MQTT 3.1.1, used for the bytes-on-wire report
+PROPERTY_LENGTH_BYTES = 1   # Every MQTT 5 PUBLISH has a property length (one byte for these small sets)
+ALIAS_PROPERTY_BYTES = 3    # Topic Alias: identifier + two-byte alias
+EXPIRY_PROPERTY_BYTES = 5   # Message Expiry Interval: identifier + four-byte seconds
+
+
+def shared_topic(topic, group):
+    """The $share subscription for `topic`, so the instances in `group` split its messages."""
+    return f"$share/{group}/{topic}" if group else topic
+
+
+class Mqtt5Publisher:
+    """
+    Publishes job messages on one MQTT 5 connection with topic aliases and message expiry.
+
+    A topic gets an alias the second time it is published, so one-off topics don't use
+    up the broker's limited alias slots; after that it is sent as an empty topic plus the
+    two-byte alias. Aliases only live as long as the connection, so reset() must be called
+    with the broker's TopicAliasMaximum on every (re)connect. Only QoS 0 messages use
+    aliases: QoS 1/2 messages may be retransmitted on a new connection, where the alias
+    would mean nothing.
+    """
+
+    def __init__(self, expiry_seconds=None, use_aliases=True):
+        self.expiry_seconds = expiry_seconds
+        self.use_aliases = use_aliases
+        self._lock = threading.Lock()
+        self._alias_maximum = 0
+        self._aliases = {}   # topic -> alias on the current connection
+        self._seen = set()   # Topics published at least once
+
+        self.publishes = 0
+        self.aliased = 0
+        self.topic_bytes_saved = 0
+        self.property_bytes = 0
+
+    def reset(self, alias_maximum):
+        """Forgets the aliases of the previous connection. Call from on_connect."""
+        with self._lock:
+            self._alias_maximum = alias_maximum if self.use_aliases else 0
+            self._aliases.clear()
+
+    def publish(self, client, topic, payload, qos=0, retain=False):
+        properties = Properties(PacketTypes.PUBLISH)
+        overhead = PROPERTY_LENGTH_BYTES
+        if self.expiry_seconds:
+            properties.MessageExpiryInterval = int(self.expiry_seconds)
+            overhead += EXPIRY_PROPERTY_BYTES
+
+        # Held across client.publish so the message that sets an alias is queued before any that use it
+        with self._lock:
+            wire_topic, alias, new_alias = topic, None, False
+            if qos == 0 and self._alias_maximum:
+                alias = self._aliases.get(topic)
+                if alias is not None:
+                    wire_topic = ""
+                elif topic in self._seen and len(self._aliases) < self._alias_maximum:
+                    alias = len(self._aliases) + 1
+                    self._aliases[topic] = alias
+                    new_alias = True
+            if alias is not None:
+                properties.TopicAlias = alias
+                overhead += ALIAS_PROPERTY_BYTES
+            self._seen.add(topic)
+
+            result = client.publish(wire_topic, payload, qos=qos, retain=retain, properties=properties)
+            if result.rc != 0:
+                if new_alias:
+                    # The broker never learned this alias, so don't use it
+                    del self._aliases[topic]
+                return result
+
+            self.publishes += 1
+            self.property_bytes += overhead
+            if not wire_topic:
+                self.aliased += 1
+                self.topic_bytes_saved += len(topic.encode("utf-8"))
+        return result
+
+    def stats(self):
+        return {
+            "publishes": self.publishes,
+            "aliased_publishes": self.aliased,
+            "aliases_in_use": len(self._aliases),
+            "topic_bytes_saved": self.topic_bytes_saved,
+            "property_bytes_added": self.property_bytes,
+            "net_bytes_saved": self.topic_bytes_saved - self.property_bytes,
+        }
@@ -0,0 +1,237 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from rate_limiter import TokenBucket
+
+COMMIT_DELAY = 0.02  # Seconds the writer gathers more recorded messages before one append and fsync
+
+
+class Outbox:
+    """
+    Bounded, disk-backed store for job messages that could not be published because
+    the client was disconnected.
+
+    Recording a message only queues it: a writer thread appends everything recorded
+    within COMMIT_DELAY to an NDJSON file with one fsync, like the journal's group commit,
+    so a burst of offline fires doesn't wait on the disk one message at a time. Once
+    written, fires survive a restart. Each message carries its own expiry time; expired messages
+    are discarded instead of replayed. When full, the oldest message is dropped. After
+    a reconnect, replay() publishes the backlog at a controlled rate. Delivery is
+    at-least-once: a crash during replay resends what was already replayed.
+    """
+
+    def __init__(self, path="outbox.jsonl", maxsize=10000, expiry_seconds=3600, replay_rate=50,
+                 clock=time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.expiry_seconds = expiry_seconds
+        self.replay_rate = replay_rate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._messages = collections.deque(maxlen=maxsize)  # [topic, payload, qos, retain, expires_at]
+        self._lines_on_disk = 0
+        self._replaying = False
+
+        # Only the writer thread touches the file. It appends _unwritten, or replaces the
+        # file with the waiting messages when a rewrite is due.
+        self._unwritten = []
+        self._rewrite_due = False
+        self._writing = False
+        self._write_failed = False  # The last write failed; the next one rewrites the file
+        self._written = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._writer = None
+
+        self.recorded = 0
+        self.replayed = 0
+        self.expired = 0
+        self.dropped = 0
+        self.last_replay = None
+
+    @property
+    def depth(self):
+        return len(self._messages)
+
+    def load(self):
+        """Reloads messages recorded before a restart. Returns how many are waiting."""
+        if not os.path.exists(self.path):
+            return 0
+        now = self._clock()
+        with self._lock:
+            try:
+                with open(self.path, 'r') as f:
+                    for line in f:
+                        try:
+                            message = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # Torn write from a crash
+                        if message[4] <= now:
+                            self.expired += 1
+                        else:
+                            self._messages.append(message)
+            except IOError as e:
+                print(f"[OUTBOX ERROR] Could not read {self.path}: {e}")
+                return 0
+            self._request_rewrite()
+        print(f"[OUTBOX] Loaded {len(self._messages)} unsent message(s) from {self.path}.")
+        return len(self._messages)
+
+    def record(self, topic, payload, qos=0, retain=False):
+        """
+        Stores a message that could not be published; it expires expiry_seconds from now.
+        Never waits for the disk: the message is written by the next group commit.
+        """
+        message = [topic, payload, qos, retain, self._clock() + self.expiry_seconds]
+        with self._lock:
+            if len(self._messages) == self.maxsize:
+                self.dropped += 1
+            self._messages.append(message)
+            self.recorded += 1
+            self._unwritten.append(message)
+            self._start_writer()
+        self._wake.set()
+
+    def flush(self, timeout=5.0):
+        """Waits until every recorded message is on disk. Returns False on timeout or if the write failed."""
+        with self._lock:
+            if self._writer is None:
+                return True
+            self._wake.set()
+            done = self._written.wait_for(lambda: not self._writing and (
+                self._write_failed or (not self._unwritten and not self._rewrite_due)), timeout)
+            return done and not self._write_failed
+
+    def _request_rewrite(self):
+        """Has the writer replace the file with the messages still waiting. Caller holds the lock."""
+        self._rewrite_due = True
+        self._unwritten = []  # The rewrite includes them
+        self._start_writer()
+        self._wake.set()
+
+    def _start_writer(self):
+        """Caller holds the lock."""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run_writer, name="outbox-writer", daemon=True)
+            self._writer.start()
+
+    def _run_writer(self):
+        while True:
+            self._wake.wait()
+            time.sleep(COMMIT_DELAY)  # Let the rest of a burst arrive, then write it with one fsync
+            self._wake.clear()
+            with self._lock:
+                # Dropped messages stay in the file until it is rewritten, so keep it bounded too
+                if self._lines_on_disk + len(self._unwritten) > 2 * self.maxsize:
+                    self._rewrite_due = True
+                if self._rewrite_due:
+                    batch, rewrite = list(self._messages), True
+                else:
+                    batch, rewrite = self._unwritten, False
+                self._unwritten = []
+                self._rewrite_due = False
+                self._writing = True
+            written = True
+            try:
+                if batch or rewrite:
+                    written = self._write(batch, rewrite)
+            finally:
+                with self._lock:
+                    # The messages are still in memory; the next write replaces the whole file
+                    self._rewrite_due = self._rewrite_due or not written
+                    self._write_failed = not written
+                    self._writing = False
+                    self._written.notify_all()
+
+    def _write(self, messages, rewrite):
+        """Appends `messages`, or replaces the file with them. Runs on the writer thread only. Returns False on failure."""
+        lines = "".join(json.dumps(message, separators=(",", ":")) + "\n" for message in messages)
+        try:
+            if not rewrite:
+                with open(self.path, 'a') as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._lines_on_disk += len(messages)
+            elif not messages:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self._lines_on_disk = 0
+            else:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w') as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self._lines_on_disk = len(messages)
+        except (IOError, OSError) as e:
+            print(f"[OUTBOX ERROR] Could not write to {self.path}, will rewrite it on the next commit: {e}")
+            return False
+        return True
+
+    def start_replay(self, publish_fn):
+        """Replays the backlog on a background thread, unless a replay is already running."""
+        with self._lock:
+            if self._replaying or not self._messages:
+                return
+            self._replaying = True
+        threading.Thread(target=self.replay, args=(publish_fn,), name="outbox-replay", daemon=True).start()
+
+    def replay(self, publish_fn):
+        """
+        Publishes waiting messages oldest first, at most replay_rate per second.
+        `publish_fn(topic, payload, qos, retain)` returns MQTTMessageInfo, or None if the
+        client is offline; replay stops at the first failure and keeps the rest.
+        """
+        bucket = TokenBucket(self.replay_rate, 1)
+        started = self._clock()
+        sent = expired = 0
+        try:
+            while True:
+                with self._lock:
+                    if not self._messages:
+                        break
+                    message = self._messages.popleft()
+                if message[4] <= self._clock():
+                    expired += 1
+                    continue
+
+                delay = bucket.reserve(time.monotonic())
+                if delay > 0:
+                    time.sleep(delay)
+                topic, payload, qos, retain, _ = message
+                info = publish_fn(topic, payload, qos, retain)
+                if info is None or info.rc != 0:
+                    with self._lock:
+                        self._messages.appendleft(message)
+                    break
+                sent += 1
+        finally:
+            elapsed = self._clock() - started
+            with self._lock:
+                self.replayed += sent
+                self.expired += expired
+                self._request_rewrite()
+                self._replaying = False
+                remaining = len(self._messages)
+            self.last_replay = {
+                "messages": sent,
+                "expired": expired,
+                "remaining": remaining,
+                "seconds": round(elapsed, 3),
+                "messages_per_second": round(sent / elapsed, 1) if elapsed > 0 else None,
+            }
+            print(f"[OUTBOX] Replayed {sent} message(s) in {elapsed:.1f}s ({expired} expired, {remaining} still waiting).")
+
+    def stats(self):
+        return {
+            "depth": len(self._messages),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "expired": self.expired,
+            "dropped": self.dropped,
+            "last_replay": self.last_replay,
+        }
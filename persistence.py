@@ -1,34 +1,323 @@
 import json
 import os
+import threading
 
-SCHEDULE_FILE = "schedules.json"
+from job_store import make_job_id
+
+SCHEDULE_FILE = "schedules.json"      # Snapshot of all jobs at the last compaction
+JOURNAL_FILE = "schedules.journal"    # Append-only log of add/remove records since that snapshot
+COMPACT_AFTER_RECORDS = 1000          # Fold the journal into a new snapshot once it grows this long
+
+
+def _fsync_directory(path):
+    """Makes a rename of `path` durable. Some platforms can't open directories; there it is skipped."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_durably(path, text):
+    """Writes `text` to a temporary file and renames it over `path`, so a crash leaves either version whole."""
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+    _fsync_directory(path)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class JobPersistence:
+    """
+    Snapshot plus journal storage for one scheduler's jobs.
+
+    Every change is appended to the journal and made durable by a group commit; the
+    journal is folded into a new snapshot once it reaches `compact_after_records`.
+    Each SchedulerEngine has its own instance, so several engines in one process
+    never share files or pending records.
+    """
+
+    def __init__(self, schedule_file=SCHEDULE_FILE, journal_file=JOURNAL_FILE,
+                 compact_after_records=COMPACT_AFTER_RECORDS):
+        self.schedule_file = schedule_file
+        self.journal_file = journal_file
+        self.compact_after_records = compact_after_records
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.RLock()  # One compaction (snapshot write) at a time
+        self._pending = []          # Encoded records waiting for the next group commit
+        self._queued = 0            # Records ever queued; the last pending record is number _queued - 1
+        self._journal_records = 0   # Records written to the journal since the last snapshot
+        self._torn_tail = False     # The last append failed and may have left half a line in the journal
+        # While a compaction runs: (number, record) of every record committed since it took its snapshot
+        self._committed_since_mark = None
+
+        # What the snapshot file looked like when we last wrote or reloaded it, so external edits can be detected
+        self._snapshot_signature = None
+        # Job IDs added/removed through the journal since the snapshot was written. An edited
+        # snapshot doesn't know about them, so hot reload must not undo them.
+        self._added_since_snapshot = set()
+        self._removed_since_snapshot = set()
+
+    @property
+    def journal_records(self):
+        """Records in the journal that are not folded into the snapshot yet."""
+        return self._journal_records
+
+    def _read_snapshot(self, set_aside_corrupt=True):
+        """
+        Reads the snapshot file. A corrupted file is set aside rather than silently overwritten,
+        or, without `set_aside_corrupt`, left in place and the error raised.
+        """
+        if not os.path.exists(self.schedule_file):
+            return None
 
-def load_schedules():
-    """Reads schedules from the JSON file. Returns an empty list if file not found or corrupted."""
-    
-    if os.path.exists(SCHEDULE_FILE):
         try:
-            with open(SCHEDULE_FILE, 'r') as f:
-                jobs_to_load = json.load(f)
-            print(f"[PERSISTENCE] Successfully loaded {len(jobs_to_load)} job(s) from {SCHEDULE_FILE}.")
-            return jobs_to_load
-        
+            with open(self.schedule_file, 'r') as f:
+                return json.load(f)
         except (IOError, json.JSONDecodeError) as e:
-            print(f"[PERSISTENCE ERROR] Failed to load schedules: {e}. Starting with an empty schedule.")
+            if not set_aside_corrupt:
+                raise
+            corrupt_copy = self.schedule_file + ".corrupt"
+            print(f"[PERSISTENCE ERROR] Failed to load snapshot: {e}. Keeping a copy at {corrupt_copy}.")
+            try:
+                os.replace(self.schedule_file, corrupt_copy)
+            except OSError:
+                pass
             return []
-    else:
-        print("[PERSISTENCE] No persistent schedule file found. Starting fresh.")
-        return []
 
+    def _replay_journal(self, jobs_by_id):
+        """Applies journal records on top of the snapshot. Returns the number of records applied."""
+        applied = 0
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue  # Written after a failed append, to end a torn line
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn line from a crash mid-append; the records around it are intact
+                    print("[PERSISTENCE] Ignoring incomplete journal record.")
+                    continue
 
-def save_schedules(persistent_jobs_list):
-    """Saves the current list of job dictionaries to the JSON file."""
-    try:
-        with open(SCHEDULE_FILE, 'w') as f:
+                if record.get("op") == "add":
+                    job = record["job"]
+                    jobs_by_id[make_job_id(job)] = job
+                elif record.get("op") == "remove":
+                    jobs_by_id.pop(record["id"], None)
+                applied += 1
+        return applied
+
+    def load_jobs_by_id(self, set_aside_corrupt=True):
+        """
+        Rebuilds the jobs from the snapshot plus the journal, keyed by job ID, so callers
+        don't have to hash every job a second time. Empty if neither file exists.
+        Read-only callers pass set_aside_corrupt=False: files are never moved, and an
+        unreadable snapshot or journal raises IOError or ValueError instead.
+        """
+        snapshot = self._read_snapshot(set_aside_corrupt)
+        if not set_aside_corrupt and snapshot is not None and not isinstance(snapshot, list):
+            raise ValueError(f"{self.schedule_file} is not a list of jobs")
+        has_journal = os.path.exists(self.journal_file)
+
+        if snapshot is None and not has_journal:
+            print("[PERSISTENCE] No persistent schedule file found. Starting fresh.")
+            return {}
+
+        jobs_by_id = {make_job_id(job): job for job in (snapshot or [])}
+        replayed = 0
+        if has_journal:
+            try:
+                replayed = self._replay_journal(jobs_by_id)
+            except IOError as e:
+                if not set_aside_corrupt:
+                    raise
+                print(f"[PERSISTENCE ERROR] Failed to read journal: {e}")
+
+        with self._lock:
+            self._journal_records = replayed
+            self._snapshot_signature = _file_signature(self.schedule_file)
+
+        print(f"[PERSISTENCE] Successfully loaded {len(jobs_by_id)} job(s) from {self.schedule_file} "
+              f"(+{replayed} journal record(s)).")
+        return jobs_by_id
+
+    def load_schedules(self, set_aside_corrupt=True):
+        """Rebuilds the job list from the snapshot plus the journal. Returns an empty list if neither exists."""
+        return list(self.load_jobs_by_id(set_aside_corrupt).values())
+
+    def journal_add(self, job_data, job_id=None):
+        """
+        Queues an 'add' record. It becomes durable on the next commit_schedules() call.
+        Passing the job ID lets hot reload tell this job apart from the snapshot's jobs.
+        """
+        record = json.dumps({"op": "add", "job": job_data}, separators=(",", ":"))
+        with self._lock:
+            self._pending.append(record)
+            self._queued += 1
+            if job_id is not None:
+                self._added_since_snapshot.add(job_id)
+                self._removed_since_snapshot.discard(job_id)
+
+    def journal_remove(self, job_id):
+        """Queues a 'remove' record. It becomes durable on the next commit_schedules() call."""
+        record = json.dumps({"op": "remove", "id": job_id}, separators=(",", ":"))
+        with self._lock:
+            self._pending.append(record)
+            self._queued += 1
+            self._removed_since_snapshot.add(job_id)
+            self._added_since_snapshot.discard(job_id)
+
+    def read_changed_snapshot(self):
+        """
+        Returns the snapshot's job list if the file was changed by someone else since we
+        last wrote or read it, otherwise None. A file that doesn't parse (e.g. an editor
+        mid-save) is skipped until it changes again.
+        """
+        signature = _file_signature(self.schedule_file)
+        with self._lock:
+            if signature is None or signature == self._snapshot_signature:
+                return None
+            self._snapshot_signature = signature
+
+        try:
+            with open(self.schedule_file, 'r') as f:
+                jobs = json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"[PERSISTENCE ERROR] Ignoring changed {self.schedule_file}, it could not be read: {e}")
+            return None
+        if not isinstance(jobs, list):
+            print(f"[PERSISTENCE ERROR] Ignoring changed {self.schedule_file}, it is not a list of jobs.")
+            return None
+        return jobs
+
+    def changes_since_snapshot(self):
+        """(added_ids, removed_ids) journaled since the snapshot was written."""
+        with self._lock:
+            return set(self._added_since_snapshot), set(self._removed_since_snapshot)
+
+    def commit_schedules(self, snapshot_source=None):
+        """
+        Group commit: appends every queued record with a single write and fsync, so the
+        cost is proportional to the change rather than the number of stored jobs.
+        If the journal has grown past compact_after_records and `snapshot_source` (a callable
+        returning the current job list) is given, the journal is folded into a new snapshot.
+        Returns False if the records could not be written; they stay queued for the next commit.
+        """
+        with self._lock:
+            if self._pending:
+                # After a failed append, start on a fresh line so a torn record can't swallow the next one
+                text = ("\n" if self._torn_tail else "") + "\n".join(self._pending) + "\n"
+                try:
+                    with open(self.journal_file, 'a') as f:
+                        f.write(text)
+                        f.flush()
+                        os.fsync(f.fileno())
+                except IOError as e:
+                    self._torn_tail = True
+                    print(f"[PERSISTENCE ERROR] Could not append to journal, will retry on the next commit: {e}")
+                    return False
+                self._torn_tail = False
+                if self._committed_since_mark is not None:
+                    first = self._queued - len(self._pending)
+                    self._committed_since_mark.extend(enumerate(self._pending, first))
+                self._journal_records += len(self._pending)
+                print(f"[PERSISTENCE] Committed {len(self._pending)} journal record(s) to {self.journal_file}.")
+                self._pending.clear()
+
+            compact_due = self._journal_records >= self.compact_after_records
+
+        if compact_due and snapshot_source is not None:
+            self.compact(snapshot_source)
+        return True
+
+    def compact(self, snapshot_source):
+        """
+        Folds the journal into a new snapshot of `snapshot_source()`. Other threads may keep
+        journaling meanwhile: records queued after the snapshot was taken stay in the new
+        journal or the queue, since the snapshot doesn't include their changes.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return  # Another thread is already compacting
+        try:
+            with self._lock:
+                # Every record numbered below the mark was queued after its change reached the
+                # job store, so the snapshot taken next includes it
+                mark = self._queued
+                self._committed_since_mark = []
+            self.save_schedules(snapshot_source(), queued_before=mark)
+        finally:
+            with self._lock:
+                self._committed_since_mark = None
+            self._compact_lock.release()
+
+    def save_schedules(self, persistent_jobs_list, queued_before=None):
+        """
+        Writes a full snapshot of the job list and resets the journal.
+        The snapshot is written to a temporary file and renamed into place, and the rename is
+        made durable before the journal is touched, so a crash at any point leaves the
+        previous snapshot or the new one with a journal that still applies on top of it.
+        `queued_before` is the record count when the job list was taken (see compact());
+        by default the list is assumed to include every record queued so far.
+        The snapshot is written without holding the journal lock, so journaling and group
+        commits carry on meanwhile; the records they commit go into the new journal.
+        """
+        with self._compact_lock:
+            with self._lock:
+                if queued_before is None:
+                    queued_before = self._queued
+                owns_mark = self._committed_since_mark is None
+                if owns_mark:
+                    self._committed_since_mark = []
+            try:
+                self._write_snapshot(persistent_jobs_list, queued_before)
+            finally:
+                if owns_mark:
+                    with self._lock:
+                        self._committed_since_mark = None
+
+    def _write_snapshot(self, persistent_jobs_list, queued_before):
+        try:
             # Use indent=4 for human-readable formatting
-            json.dump(persistent_jobs_list, f, indent=4)
-        print(f"[PERSISTENCE] Scheduler state saved to {SCHEDULE_FILE}.")
-    except IOError as e:
-        print(f"[PERSISTENCE ERROR] Could not save schedules to file: {e}")
+            _write_durably(self.schedule_file, json.dumps(persistent_jobs_list, indent=4))
+        except IOError as e:
+            print(f"[PERSISTENCE ERROR] Could not save schedules to file: {e}")
+            return
+
+        with self._lock:
+            self._snapshot_signature = _file_signature(self.schedule_file)
+            # Records committed or still queued after the job list was taken are not in it
+            later = [record for number, record in self._committed_since_mark if number >= queued_before]
+            first_pending = self._queued - len(self._pending)
+            try:
+                _write_durably(self.journal_file, "".join(record + "\n" for record in later))
+            except IOError as e:
+                print(f"[PERSISTENCE ERROR] Could not save schedules to file: {e}")
+                return
+
+            self._journal_records = len(later)
+            self._torn_tail = False
+            del self._pending[:max(0, queued_before - first_pending)]
+            self._committed_since_mark.clear()
+            if not later and not self._pending:
+                # Otherwise keep the IDs: hot reload must not undo changes the new snapshot lacks
+                self._added_since_snapshot.clear()
+                self._removed_since_snapshot.clear()
+        print(f"[PERSISTENCE] Scheduler state saved to {self.schedule_file}.")
 
-# Note: This file only contains functions and constants, no execution logic.
\ No newline at end of file
+# Note: This file only contains the storage class and constants, no execution logic.
@@ -1,19 +1,31 @@
 #!/usr/bin/env python3
 """
 MQTT Scheduler Ping Test
-Sends a ping to the scheduler and waits for a pong response.
+Sends a ping to the scheduler and waits for the matching pong.
+
+The ping carries a correlation ID and a private reply topic, so retained status
+messages and other clients' pongs are never mistaken for our answer. The script
+returns as soon as the pong arrives and prints the round-trip time.
 """
 import paho.mqtt.client as mqtt
 import json
+import threading
 import time
 import sys
+import uuid
 
 BROKER = "broker.hivemq.com"
 PORT = 1883
 PING_TOPIC = "myhome/scheduler/ping"
 STATUS_TOPIC = "myhome/scheduler/status"
+PING_TIMEOUT = 5  # seconds to wait for the pong
+
+# Private reply topic and correlation ID for this probe
+CORRELATION_ID = uuid.uuid4().hex[:12]
+REPLY_TOPIC = f"{STATUS_TOPIC}/reply/{CORRELATION_ID}"
 
-response_received = False
+pong_received = threading.Event()
+sent_at = None
 
 def on_connect(client, userdata, flags, reason_code, properties):
     if reason_code.is_failure:
@@ -21,70 +33,63 @@ def on_connect(client, userdata, flags, reason_code, properties):
         sys.exit(1)
     else:
         print(f"✓ Connected to {BROKER}:{PORT}")
-        
-        # Subscribe to status topic first
-        client.subscribe(STATUS_TOPIC)
-        print(f"✓ Subscribed to {STATUS_TOPIC}")
-        
-        # Wait a moment then send ping
-        time.sleep(0.5)
-        client.publish(PING_TOPIC, "ping")
-        print(f"✓ Sent ping to {PING_TOPIC}")
-        print("\nWaiting for response...")
+
+        # Subscribe to our private reply topic first
+        client.subscribe(REPLY_TOPIC)
+        print(f"✓ Subscribed to {REPLY_TOPIC}")
+
+def on_subscribe(client, userdata, mid, reason_code_list, properties):
+    global sent_at
+    # Only ping once the broker has confirmed the subscription, so the pong can't be missed
+    sent_at = time.perf_counter()
+    client.publish(PING_TOPIC, json.dumps({"id": CORRELATION_ID, "reply_to": REPLY_TOPIC}))
+    print(f"✓ Sent ping {CORRELATION_ID} to {PING_TOPIC}")
+    print("\nWaiting for response...")
 
 def on_message(client, userdata, msg):
-    global response_received
-    
-    if msg.topic == STATUS_TOPIC:
-        response_received = True
-        try:
-            status = json.loads(msg.payload.decode('utf-8'))
-            
-            print("\n" + "="*50)
-            print("📡 SCHEDULER STATUS RECEIVED")
-            print("="*50)
-            print(f"Status:        {status.get('status', 'unknown')}")
-            print(f"Timestamp:     {status.get('timestamp', 'N/A')}")
-            print(f"Active Jobs:   {status.get('active_jobs', 0)}")
-            print(f"Persistent:    {status.get('total_persistent_jobs', 0)}")
-            print(f"Ping Echo:     {status.get('ping_received', 'N/A')}")
-            print("="*50)
-            
-            if status.get('status') in ['alive', 'online']:
-                print("\n✅ Scheduler is ALIVE and CONNECTED!")
-            else:
-                print("\n⚠️  Scheduler responded but status is unusual")
-                
-        except json.JSONDecodeError:
-            print(f"\n⚠️  Received non-JSON response: {msg.payload.decode('utf-8')}")
-        
-        # Disconnect after receiving response
-        client.disconnect()
+    if msg.topic != REPLY_TOPIC:
+        return
+    try:
+        status = json.loads(msg.payload.decode('utf-8'))
+    except json.JSONDecodeError:
+        print(f"\n⚠️  Received non-JSON response: {msg.payload.decode('utf-8')}")
+        return
+    if status.get('id') != CORRELATION_ID:
+        return
 
-def on_disconnect(client, userdata, reason_code, properties):
-    if not response_received:
-        print("\n❌ Disconnected without receiving response")
-        print("   Scheduler may be offline or not responding")
-        sys.exit(1)
+    rtt_ms = (time.perf_counter() - sent_at) * 1000
+    print("\n" + "="*50)
+    print("📡 SCHEDULER STATUS RECEIVED")
+    print("="*50)
+    print(f"Status:        {status.get('status', 'unknown')}")
+    print(f"Timestamp:     {status.get('timestamp', 'N/A')}")
+    print(f"Active Jobs:   {status.get('active_jobs', 0)}")
+    print(f"Persistent:    {status.get('total_persistent_jobs', 0)}")
+    print(f"Round Trip:    {rtt_ms:.1f} ms")
+    print("="*50)
+
+    if status.get('status') in ['alive', 'online']:
+        print("\n✅ Scheduler is ALIVE and CONNECTED!")
+    else:
+        print("\n⚠️  Scheduler responded but status is unusual")
+    pong_received.set()
 
 # Create client
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 client.on_connect = on_connect
+client.on_subscribe = on_subscribe
 client.on_message = on_message
-client.on_disconnect = on_disconnect
 
-# Set timeout
 print(f"Connecting to {BROKER}:{PORT}...")
 client.connect(BROKER, PORT, 60)
-
-# Run for max 5 seconds
 client.loop_start()
-time.sleep(5)
 
-if not response_received:
-    print("\n⏱️  Timeout: No response received within 5 seconds")
+# Return as soon as the matching pong arrives, or give up after PING_TIMEOUT
+if not pong_received.wait(PING_TIMEOUT):
+    print(f"\n⏱️  Timeout: No response received within {PING_TIMEOUT} seconds")
     print("   Scheduler is likely OFFLINE or not connected")
     client.loop_stop()
     sys.exit(1)
 
+client.disconnect()
 client.loop_stop()
@@ -0,0 +1,86 @@
+import queue
+import threading
+import time
+import zlib
+
+
+class PublisherPool:
+    """
+    A small pool of extra MQTT connections for publishing job messages.
+
+    Each connection has its own queue and worker thread, so a burst of synchronized
+    fires is published over several sockets in parallel while the timer thread only
+    enqueues. Messages are routed by a hash of their topic, which keeps the messages
+    for one topic in order on one connection. If a RateLimiter is given, every worker
+    waits for it before publishing, which spreads bursts out at the configured rate.
+    """
+
+    def __init__(self, client_factory, size, publish_fn, limiter=None, bursts=None):
+        if size < 1:
+            raise ValueError(f"Publisher pool needs at least one connection, got {size!r}")
+        self._client_factory = client_factory  # client_factory(index) -> unconnected paho Client
+        self._publish_fn = publish_fn          # publish_fn(client, topic, payload, qos, retain) -> MQTTMessageInfo or None
+        self._limiter = limiter
+        self._bursts = bursts                  # Optional metrics.BurstTracker
+        self.size = size
+        self.clients = []
+        self._queues = [queue.Queue() for _ in range(size)]
+        self._workers = []
+
+    @property
+    def depth(self):
+        """Messages waiting to be published across all connections."""
+        return sum(q.qsize() for q in self._queues)
+
+    def start(self, host, port, keepalive):
+        """Connects every pooled client in the background and starts the worker threads."""
+        for index in range(self.size):
+            client = self._client_factory(index)
+            client.connect_async(host, port, keepalive)
+            client.loop_start()
+            self.clients.append(client)
+
+            worker = threading.Thread(target=self._drain, args=(index,), name=f"publisher-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        for q in self._queues:
+            q.put(None)
+        for worker in self._workers:
+            worker.join()
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+    def _index_for(self, topic):
+        return zlib.crc32(topic.encode("utf-8")) % self.size
+
+    def submit(self, topic, payload, qos=0, retain=False):
+        """Queues a message on its topic's connection without waiting for it to be sent."""
+        if self._bursts is not None:
+            self._bursts.queued()
+        self._queues[self._index_for(topic)].put((topic, payload, qos, retain))
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publishes immediately on the topic's connection (used by the asyncio dispatcher)."""
+        return self._publish_fn(self.clients[self._index_for(topic)], topic, payload, qos, retain)
+
+    def _drain(self, index):
+        client, messages = self.clients[index], self._queues[index]
+        while True:
+            message = messages.get()
+            if message is None:
+                return
+            topic, payload, qos, retain = message
+            try:
+                if self._limiter:
+                    delay = self._limiter.reserve(topic)
+                    if delay > 0:
+                        time.sleep(delay)
+                self._publish_fn(client, topic, payload, qos, retain)
+            except Exception as e:
+                print(f"[PUBLISHER ERROR] Connection {index} failed to publish to {topic}: {e}")
+            finally:
+                if self._bursts is not None:
+                    self._bursts.done()
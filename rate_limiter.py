@@ -0,0 +1,72 @@
+import threading
+import time
+import zlib
+
+
+def jitter_offset(key, spread_seconds):
+    """
+    Deterministic offset in [0, spread_seconds) derived from `key` (a job ID). The same
+    job always gets the same offset, so restarts don't reshuffle the fire times.
+    """
+    if not spread_seconds:
+        return 0.0
+    return zlib.crc32(key.encode("utf-8")) / 2 ** 32 * spread_seconds
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `burst` tokens.
+    reserve() always takes a token and returns how long the caller must wait before
+    using it, so concurrent publishers queue up behind each other instead of retrying.
+    """
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Token bucket needs rate > 0 and burst >= 1, got rate={rate!r} burst={burst!r}")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = None
+
+    def reserve(self, now):
+        """Takes one token and returns the seconds to wait before it may be used."""
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Publish rate limit with one global bucket and optional per-topic-prefix buckets.
+    A message waits for both the global bucket and the bucket of the longest prefix
+    its topic matches. Safe to share between publisher threads.
+    """
+
+    def __init__(self, rate=None, burst=100, prefix_limits=None, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._global = TokenBucket(rate, burst) if rate else None
+        # prefix -> TokenBucket, longest prefixes first so the most specific one wins
+        self._prefixes = sorted(
+            ((prefix, TokenBucket(prefix_rate, prefix_burst))
+             for prefix, (prefix_rate, prefix_burst) in (prefix_limits or {}).items()),
+            key=lambda item: len(item[0]), reverse=True)
+        self.delayed = 0
+
+    def __bool__(self):
+        return self._global is not None or bool(self._prefixes)
+
+    def reserve(self, topic):
+        """Returns the seconds the caller must wait before publishing to `topic`."""
+        with self._lock:
+            now = self._clock()
+            delay = self._global.reserve(now) if self._global is not None else 0.0
+            for prefix, bucket in self._prefixes:
+                if topic.startswith(prefix):
+                    delay = max(delay, bucket.reserve(now))
+                    break
+            if delay > 0:
+                self.delayed += 1
+        return delay
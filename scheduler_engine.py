@@ -0,0 +1,1309 @@
+import paho.mqtt.client as mqtt
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+
+from persistence import JobPersistence
+from timer_engine import TimerEngine
+from job_store import JobStore, make_job_id
+from dispatcher import PublishDispatcher
+from metrics import Metrics, BurstTracker
+from rate_limiter import RateLimiter, jitter_offset
+from publisher_pool import PublisherPool
+from outbox import Outbox
+from ingest import MutationWorker
+from mqtt5 import Mqtt5Publisher, shared_topic
+from event_log import EventLog
+
+# Fields an update request may change; setting one to null removes it
+UPDATABLE_FIELDS = ("type", "topic", "payload", "time", "devices", "group")
+
+
+# =================================================================
+# --- 1. CONFIGURATION ---
+# =================================================================
+
+class SchedulerConfig:
+    """
+    Settings for one SchedulerEngine. The class attributes below are the defaults; pass
+    overrides as keyword arguments, e.g. SchedulerConfig(broker_address="10.0.0.5").
+    Unknown names raise TypeError, so a typo in a config file is not silently ignored.
+    """
+
+    broker_address = "broker.hivemq.com"
+    port = 1883
+    keepalive = 60
+    username = None
+    password = None
+
+    control_topic = "myhome/scheduler/submit_job"
+    ping_topic = "myhome/scheduler/ping"            # Topic to receive ping requests
+    status_topic = "myhome/scheduler/status"        # Topic to publish pong/status responses
+    list_jobs_topic = "myhome/scheduler/list_jobs"  # Topic to request list of all jobs
+    cancel_job_topic = "myhome/scheduler/cancel_job"  # Topic to cancel a job by its ID
+    update_job_topic = "myhome/scheduler/update_job"  # Topic to change fields of a job by its ID
+    metrics_topic = "myhome/scheduler/metrics"      # Topic where periodic metrics reports are published
+    metrics_interval = 60                           # Seconds between metrics reports
+    events_topic = "myhome/scheduler/events"        # Topic to query the recent events ring buffer
+    serve_requests = True   # Subscribe to the topics above; sharded workers leave them to the coordinator
+
+    schedule_file = "schedules.json"      # Snapshot of all jobs
+    journal_file = "schedules.journal"    # Changes since the snapshot
+    compact_after_records = 1000          # Fold the journal into a new snapshot once it grows this long
+
+    # Events are formatted and written by a background thread, never on the timer or network thread
+    log_level = "info"            # "debug" also writes every fire; "warning" or "error" keeps only problems
+    log_format = "text"           # "text" for "[timestamp] message" lines, "json" for one JSON object per line
+    log_sample_rates = {}         # Write 1 in N of a high-rate event, e.g. {"publish": 100}; warnings and errors are never sampled
+    recent_events_size = 1000     # Recent fire/submit/cancel/update/reload events, warnings and errors kept for the events topic
+
+    list_page_size = 100      # Jobs per list response when the request doesn't set "limit"
+    list_max_page_size = 1000
+    list_cache_entries = 64   # Serialized list replies kept until the job store next changes
+
+    # "threaded": jobs fire on a timer thread and publish inline.
+    # "asyncio":  timers and inbound messages share one event loop; fires are handed to a bounded publish queue.
+    runtime_mode = "threaded"
+    dispatch_queue_size = 10000   # Max messages waiting to be published (asyncio mode)
+    dispatch_max_inflight = 100   # Max unacknowledged QoS 1/2 publishes (asyncio mode)
+    dispatch_overflow = "block"   # Full queue policy: "block", "drop_oldest" or "spill"
+
+    # Burst smoothing for fleets that share fire times (e.g. 2,000 daily jobs at "22:00")
+    publish_pool_size = 0         # Extra MQTT connections that publish job messages in parallel; 0 uses the main client
+    publish_rate_limit = None     # Max job messages per second across all connections; None for no limit
+    publish_burst = 100           # Messages that may go out back to back before the rate limit applies
+    prefix_rate_limits = {}       # Per-topic-prefix limits, e.g. {"myhome/esp8266/": (50, 20)} as (rate, burst)
+    fire_jitter_seconds = 0       # Spread each job's fire time by a fixed per-job offset in [0, N) seconds
+
+    # Watch the schedule file and apply external edits without a restart
+    hot_reload = False
+    hot_reload_interval = 2       # Seconds between checks of the schedule file
+
+    # Job messages fired while disconnected are kept in a disk-backed outbox and replayed on reconnect
+    outbox_file = "outbox.jsonl"
+    outbox_max_messages = 10000   # Oldest messages are dropped beyond this
+    outbox_expiry_seconds = 3600  # Messages older than this are discarded instead of replayed
+    outbox_replay_rate = 50       # Messages per second while replaying after a reconnect
+
+    # Opt-in MQTT 5 (needs an MQTT 5 broker): job messages use topic aliases and carry an expiry
+    mqtt5 = False
+    mqtt5_topic_aliases = True       # Send repeated job topics as two-byte aliases (QoS 0 only)
+    message_expiry_seconds = 300     # Brokers drop queued job messages older than this; None keeps them
+    # Set to e.g. "schedulers" to consume the control and ping topics via $share/<group>/..., so several
+    # scheduler instances split submissions and pings. Each instance keeps its own jobs and files.
+    shared_subscription_group = None
+
+    # Submit/cancel/update messages are validated on the network thread and applied by one
+    # worker thread, which group-commits the journal and acks once the changes are durable
+    ingest_worker = True
+    ingest_queue_size = 10000     # Messages waiting for the worker; a full queue makes the network thread wait
+    ingest_commit_delay = 0.02    # Seconds to gather more changes into one group commit
+    ingest_max_batch = 1000       # Changes applied before committing, even if more are waiting
+
+    # Named topic lists for fan-out jobs that set "group" instead of "topic", e.g.
+    # {"night_relays": ["myhome/esp8266/relay1/cmd", "myhome/esp8266/relay2/cmd"]}
+    topic_groups = {}
+    device_placeholder = "{device}"  # Replaced by each entry of a fan-out job's "devices" list
+
+    def __init__(self, **overrides):
+        for name in self.settings():
+            default = getattr(SchedulerConfig, name)
+            if isinstance(default, dict):
+                setattr(self, name, dict(default))  # Never share a mutable default between configs
+        for name, value in overrides.items():
+            if name not in self.settings():
+                raise TypeError(f"Unknown scheduler setting {name!r}")
+            setattr(self, name, value)
+
+    @classmethod
+    def settings(cls):
+        """Names of every setting."""
+        return [name for name, value in vars(SchedulerConfig).items()
+                if not name.startswith("_") and not callable(value) and not isinstance(value, classmethod)]
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.settings()}
+
+
+# =================================================================
+# --- 2. MESSAGE PARSING ---
+# =================================================================
+
+def _is_complete(job_data):
+    """A job needs a non-empty type, payload and time, and a topic or a topic group."""
+    return isinstance(job_data, dict) and all(
+        [job_data.get("type"), job_data.get("topic") or job_data.get("group"), job_data.get("payload"),
+         job_data.get("time")])
+
+
+def _topic_error(topic):
+    """Why paho would refuse to publish to `topic` (it raises on every fire), or None if it is usable."""
+    if not isinstance(topic, str) or not topic:
+        return f"topic must be a non-empty string, got {topic!r}"
+    if "#" in topic or "+" in topic:
+        return f"topic {topic!r} contains a wildcard; jobs must publish to a concrete topic"
+    return None
+
+
+def _parse_job_batch(text):
+    """
+    Splits a bulk submission into (job_data, error) entries. Accepts a JSON array or
+    newline-delimited JSON objects. Returns None when the payload is a single job.
+    """
+    if text.startswith("["):
+        return [(job_data, None) for job_data in json.loads(text)]
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) < 2:
+        return None
+    try:
+        # A single job pretty-printed over several lines is not a batch
+        json.loads(text)
+        return None
+    except json.JSONDecodeError:
+        pass
+
+    entries = []
+    for line in lines:
+        try:
+            entries.append((json.loads(line), None))
+        except json.JSONDecodeError as e:
+            entries.append((None, f"Invalid JSON: {e}"))
+    return entries
+
+
+def _parse_list_request(raw_payload):
+    """The legacy "list" payload means default options; otherwise the payload is a JSON object of options."""
+    text = raw_payload.decode('utf-8').strip()
+    if not text.startswith("{"):
+        return {}
+    return json.loads(text)
+
+
+def _job_matches(job, request):
+    """Applies the optional list filters: topic_prefix, type and a time_from/time_to window."""
+    if "topic_prefix" in request and not str(job.get("topic") or "").startswith(request["topic_prefix"]):
+        return False
+    if "type" in request and job.get("type") != request["type"]:
+        return False
+    if "time_from" in request or "time_to" in request:
+        # The window applies to time-of-day jobs; "HH:MM" strings compare correctly as text
+        time_value = job.get("time")
+        if not isinstance(time_value, str):
+            return False
+        if time_value < request.get("time_from", "00:00") or time_value > request.get("time_to", "23:59:59"):
+            return False
+    return True
+
+
+def _parse_job_id(raw_payload):
+    """Accepts either a bare job ID or a JSON object with an "id" field. Raises ValueError if there is no ID."""
+    text = raw_payload.decode('utf-8').strip()
+    job_id = json.loads(text).get("id") if text.startswith("{") else text
+    if not isinstance(job_id, str) or not job_id:
+        raise ValueError('expected a job ID or {"id": "<job id>"}')
+    return job_id
+
+
+def _parse_update(raw_payload):
+    """An update is {"id": "...", <fields to change>}. Raises ValueError for anything else."""
+    changes = json.loads(raw_payload.decode('utf-8'))
+    if not isinstance(changes, dict) or not isinstance(changes.get("id"), str) or not changes["id"]:
+        raise ValueError('expected a JSON object with an "id" and the fields to change')
+    return changes
+
+
+def _parse_ping(raw_payload):
+    """
+    A ping is plain text (answered on the status topic), or JSON with a correlation "id"
+    and a private "reply_to" topic. Returns (text, correlation_id, reply_topic).
+    """
+    text = raw_payload.decode('utf-8').strip()
+    if text.startswith("{"):
+        request = json.loads(text)
+        return str(request.get("id", "ping")), request.get("id"), request.get("reply_to")
+    return text, None, None
+
+
+# =================================================================
+# --- 3. ENGINE ---
+# =================================================================
+
+class SchedulerEngine:
+    """
+    One scheduler: its job store, persistence files, timers and MQTT connection.
+
+    start() restores the persisted jobs and then fires them and serves MQTT requests in
+    the background; stop() shuts everything down again. Nothing happens on import or
+    construction. Several engines can share one TimerEngine, and an EngineHost runs
+    many of them in one process on a shared timer and I/O loop.
+    """
+
+    def __init__(self, config=None, timers=None, client=None, name=None):
+        self.config = config or SchedulerConfig()
+        self.name = name or self.config.broker_address
+
+        # Index of all active jobs (compact JobRecords), keyed by job ID
+        self.store = JobStore()
+        # Timer handle for every job ID, so a job can be cancelled without searching
+        self.job_timers = {}
+        # Fire-drift, latency and throughput metrics, published on the metrics topic
+        self.metrics = Metrics()
+        # Queued, level-filtered event log with a ring buffer of recent events
+        self.log = EventLog(self.config.log_level, self.config.log_format, self.config.log_sample_rates,
+                            self.config.recent_events_size)
+        # Deadline-driven timer engine that fires every registered job; possibly shared with other engines
+        self._owns_timers = timers is None
+        self.timers = timers if timers is not None else TimerEngine()  # An empty TimerEngine is falsy
+        # Serializes job store changes between the network thread, the timer thread and the mutation worker
+        self.jobs_lock = threading.RLock()
+        # Every job timer shares this one bound method; `self._fire_job` would create a new one per job
+        self._job_callback = self._fire_job
+        self.persistence = JobPersistence(self.config.schedule_file, self.config.journal_file,
+                                          self.config.compact_after_records)
+
+        # Bounded publish queue; only created in asyncio mode
+        self.dispatcher = None
+        # Publish rate limiter and pooled publisher connections; only created when burst smoothing is configured
+        self.limiter = None
+        self.publishers = None
+        # Times how long each burst of queued job messages takes to drain
+        self.bursts = BurstTracker(self.metrics.record_burst)
+        # Fires that could not be published while offline
+        self.outbox = Outbox(self.config.outbox_file, self.config.outbox_max_messages,
+                             self.config.outbox_expiry_seconds, self.config.outbox_replay_rate)
+        # MutationWorker, created by start_ingest() when ingest_worker is set; None applies changes inline
+        self.ingest = None
+        # Mqtt5Publisher per MQTT 5 connection (main client and pooled publishers)
+        self.mqtt5_publishers = {}
+
+        # Serialized list replies for the current job store version, keyed by the request options
+        self._list_cache = {}
+        self._list_cache_version = None
+
+        self._network = None         # EngineHost doing this engine's socket I/O, if any
+        self._event_loop = None      # Set in asyncio mode
+        self._metrics_timer = None
+        self._stopping = threading.Event()
+
+        self.client = client or self._new_client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self._on_message_locked
+        if self.config.username and self.config.password:
+            self.client.username_pw_set(self.config.username, self.config.password)
+
+    # -----------------------------------------------------------------
+    # Lifecycle
+    # -----------------------------------------------------------------
+
+    def start(self, network=None, run_timers=True):
+        """
+        Restores the persisted jobs, connects and starts firing jobs, without blocking.
+        `network` is an EngineHost that does the socket I/O; without one the client runs
+        its own network thread. With run_timers, an engine that owns its TimerEngine
+        fires jobs on a background thread.
+        """
+        if self.config.runtime_mode not in ("threaded", "asyncio"):
+            raise ValueError(f"Unknown runtime mode {self.config.runtime_mode!r}")
+        if self.config.runtime_mode == "asyncio" and network is not None:
+            raise ValueError("Engines on a shared host must use the threaded runtime mode")
+
+        # 1. Load any previously saved jobs BEFORE connecting to the broker
+        self.restore_jobs()
+
+        # Periodic metrics report (an internal timer, so its own lateness is measured as loop lag)
+        self._metrics_timer = self.timers.every(self.config.metrics_interval, self._on_metrics_timer)
+
+        # Rate limiter and pooled publisher connections, if configured
+        self.start_burst_smoothing()
+
+        # Apply job changes on their own thread, off the network thread
+        self.start_ingest()
+
+        # Pick up edits of the schedule file while running
+        if self.config.hot_reload:
+            threading.Thread(target=self.watch_schedule_file, name=f"schedule-watch-{self.name}", daemon=True).start()
+            print(f"Watching the schedule file for changes every {self.config.hot_reload_interval}s")
+
+        # In asyncio mode, inbound messages are handed to the event loop so one thread owns the job store
+        if self.config.runtime_mode == "asyncio":
+            self._attach_event_loop(asyncio.get_event_loop())
+
+        # 2. Connect to the broker; the network loop keeps retrying if it is not reachable yet
+        print(f"\nAttempting to connect to {self.config.broker_address}:{self.config.port}...")
+        self._network = network
+        if network is not None:
+            self.log.source = self.name  # Several engines write to the same output
+            network.connect(self.client, self.config.broker_address, self.config.port, self.config.keepalive)
+        else:
+            self.client.connect_async(self.config.broker_address, self.config.port, self.config.keepalive)
+            self.client.loop_start()
+
+        if run_timers and self._owns_timers and self.config.runtime_mode == "threaded":
+            threading.Thread(target=self.timers.run_forever, name=f"timers-{self.name}", daemon=True).start()
+
+    def run_forever(self):
+        """Starts the engine and blocks, firing jobs on the calling thread, until Ctrl+C."""
+        try:
+            if self.config.runtime_mode == "asyncio":
+                event_loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(event_loop)
+                self.start(run_timers=False)
+                print("\nScheduler Initialized and Running.")
+                print(f"Runtime: asyncio (dispatch queue {self.config.dispatch_queue_size}, "
+                      f"overflow policy '{self.config.dispatch_overflow}')")
+                event_loop.run_until_complete(self._run_asyncio())
+            else:
+                self.start(run_timers=False)
+                print("\nScheduler Initialized and Running.")
+                print(f"System Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                print(f"Waiting for Commands on: {self.config.control_topic}")
+                # 3. Main Loop: sleeps until the next job deadline instead of polling every second
+                self.timers.run_forever()
+        except KeyboardInterrupt:
+            print("\nStopping scheduler...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stops firing and serving requests, commits what is pending and disconnects."""
+        self._stopping.set()
+        if self._metrics_timer is not None:
+            self.timers.cancel(self._metrics_timer)
+            self._metrics_timer = None
+        with self.jobs_lock:
+            for handle in self.job_timers.values():
+                self.timers.cancel(handle)
+        if self._owns_timers:
+            self.timers.stop()
+
+        # Drain the mutation worker while the client still runs, so the acks of its last group commit are sent
+        if self.ingest is not None:
+            self.ingest.stop()
+            self.ingest = None
+        if self.publishers is not None:
+            self.publishers.stop()
+            self.publishers = None
+        if self._network is not None:
+            self._network.disconnect(self.client)
+        else:
+            # The DISCONNECT is queued behind those acks; loop_stop() then waits for the loop to send them
+            self.client.disconnect()
+            self.client.loop_stop()
+        self.outbox.flush()
+        self.log.flush()
+
+    # -----------------------------------------------------------------
+    # Publishing
+    # -----------------------------------------------------------------
+
+    def _new_client(self):
+        """A paho client; with mqtt5 set it speaks MQTT 5 and job messages on it go through an Mqtt5Publisher."""
+        if not self.config.mqtt5:
+            return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        new_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, protocol=mqtt.MQTTv5)
+        self.mqtt5_publishers[new_client] = Mqtt5Publisher(self.config.message_expiry_seconds,
+                                                           self.config.mqtt5_topic_aliases)
+        return new_client
+
+    def reset_topic_aliases(self, connected_client, properties):
+        """Starts a fresh alias table after a (re)connect, sized by the broker's TopicAliasMaximum."""
+        publisher = self.mqtt5_publishers.get(connected_client)
+        if publisher is not None:
+            publisher.reset(getattr(properties, "TopicAliasMaximum", 0) if properties is not None else 0)
+
+    def publish_status(self, topic, payload, qos=0):
+        """
+        Publishes a job's message, or hands it to the dispatcher queue in asyncio mode or to
+        the publisher pool when burst smoothing is enabled.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.submit(topic, payload, qos)
+        elif self.publishers is not None:
+            self.publishers.submit(topic, payload, qos)
+        else:
+            self._publish_now(topic, payload, qos)
+
+    def _publish_now(self, topic, payload, qos=0, retain=False, publisher=None, use_outbox=True):
+        """
+        Publishes immediately on `publisher` (a pooled connection) or the main client.
+        Returns paho's MQTTMessageInfo, or None when not connected, in which case the
+        message is kept in the outbox for replay (unless `use_outbox` is False).
+        """
+        publisher = publisher or self.client
+        if publisher.is_connected():
+            started = time.perf_counter()
+            mqtt5_publisher = self.mqtt5_publishers.get(publisher)
+            if mqtt5_publisher is not None:
+                result = mqtt5_publisher.publish(publisher, topic, payload, qos, retain)
+            else:
+                result = publisher.publish(topic, payload, qos=qos, retain=retain)
+            self.metrics.record_publish(time.perf_counter() - started)
+
+            # Only the event is recorded here; formatting and writing happen on the log writer thread
+            status = result[0]
+            if status == mqtt.MQTT_ERR_SUCCESS:
+                self.log.info("publish", "PUBLISHED: '{payload}' to Topic: {topic}", topic=topic, payload=payload)
+            else:
+                self.log.error("publish", "FAILED to publish message to Topic: {topic}", topic=topic, rc=status)
+            return result
+        else:
+            if use_outbox:
+                self.outbox.record(topic, payload, qos, retain)
+                self.log.warning("outbox", "Client not connected. Kept message for {topic} in the outbox ({depth} waiting).",
+                                 topic=topic, depth=self.outbox.depth)
+            else:
+                self.log.warning("publish", "Client not connected. Skipping publish.", topic=topic)
+            return None
+
+    def _replay_publish(self, topic, payload, qos, retain, publisher=None):
+        """Publish function for outbox replay; a failure leaves the message in the outbox rather than re-recording it."""
+        return self._publish_now(topic, payload, qos, retain, publisher, use_outbox=False)
+
+    def _on_metrics_timer(self):
+        self.metrics.record_loop_lag(self.timers.late_by)
+        self.publish_metrics()
+
+    def publish_metrics(self):
+        """Publishes the metrics for the window that just ended on the metrics topic."""
+        if self.dispatcher is not None:
+            queue_depth = self.dispatcher.depth
+        elif self.publishers is not None:
+            queue_depth = self.publishers.depth
+        else:
+            queue_depth = None
+        report = self.metrics.report(queue_depth=queue_depth)
+        report["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        report["active_jobs"] = len(self.job_timers)
+        if self.limiter is not None:
+            report["rate_limited_total"] = self.limiter.delayed
+        report["outbox"] = self.outbox.stats()
+        report["event_log"] = self.log.stats()
+        if self.ingest is not None:
+            report["ingest_queue_depth"] = self.ingest.depth
+        if self.mqtt5_publishers:
+            report["mqtt5"] = self.mqtt5_stats()
+        self.client.publish(self.config.metrics_topic, json.dumps(report, separators=(",", ":")))
+
+    def mqtt5_stats(self):
+        """Topic alias use and bytes on the wire saved versus MQTT 3.1.1, summed over all connections."""
+        totals = {}
+        for publisher in list(self.mqtt5_publishers.values()):
+            for key, value in publisher.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def publish_reply(self, reply):
+        """Publishes a JSON status reply (ack or error) on the status topic."""
+        reply["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.client.publish(self.config.status_topic, json.dumps(reply))
+
+    def reply_after_commit(self, reply):
+        """
+        Publishes a reply to a job change. On the mutation worker it waits for the next group
+        commit, so acks only go out once the change is durable and replies keep their order.
+        """
+        if self.ingest is not None and self.ingest.in_worker():
+            self.ingest.defer(reply)
+        else:
+            self.publish_reply(reply)
+
+    # -----------------------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------------------
+
+    def _jobs_snapshot(self):
+        """The job list for a compaction, which may run on the mutation worker outside jobs_lock."""
+        with self.jobs_lock:
+            return self.store.jobs()
+
+    def commit_jobs(self):
+        """Group-commits the queued journal records and records how long the commit took."""
+        started = time.perf_counter()
+        durable = self.persistence.commit_schedules(self._jobs_snapshot)
+        self.metrics.record_commit(time.perf_counter() - started)
+        return durable
+
+    def persist_jobs(self):
+        """Commits journaled changes now, or leaves them to the mutation worker's next group commit."""
+        if self.ingest is not None:
+            self.ingest.request_commit()
+        else:
+            self.commit_jobs()
+
+    def restore_jobs(self):
+        """
+        Loads the persisted jobs and re-registers them. The journal is folded into a fresh
+        snapshot only if it has records, so a clean restart never rewrites a large snapshot.
+        """
+        started = time.perf_counter()
+        self.outbox.load()
+        jobs_by_id = self.persistence.load_jobs_by_id()
+        restored = 0
+        for job_id, job_data in jobs_by_id.items():
+            # Re-populate the index and recreate the job; the ID is already known from loading
+            if self.add_job(job_data, job_id, announce=False)[1] is None:
+                restored += 1
+
+        # Fold the replayed journal into a fresh snapshot so the next startup only reads one file
+        if self.persistence.journal_records:
+            self.persistence.save_schedules(self.store.jobs())
+        print(f"[PERSISTENCE] Restored {restored} job(s) in {time.perf_counter() - started:.2f}s.")
+        return restored
+
+    # -----------------------------------------------------------------
+    # Jobs
+    # -----------------------------------------------------------------
+
+    def _fire_job(self, job_id):
+        """
+        Timer callback shared by every job. It looks the job up by ID when it fires rather
+        than capturing the job's fields in a per-job closure, which keeps each job small.
+        """
+        job = self.store.record(job_id)
+        if job is None:
+            return
+        late_by = self.timers.late_by
+        self.metrics.record_fire(job_id, late_by)
+        self.log.debug("fire", "FIRED job {job_id} ({late_ms} ms late)", job_id=job_id, late_ms=round(late_by * 1000, 3))
+
+        # Execute the primary task
+        extra = job.extra
+        if extra is not None and ("devices" in extra or "group" in extra):
+            self.publish_fan_out(job, job_id)
+        else:
+            self.publish_status(job.topic, job.payload, job.qos or 0)
+
+        # --- LOGIC FOR ONE-TIME JOB CANCELLATION ---
+        if job.type == "once":
+            # The timer engine does not re-arm one-shot timers, so only the index entry needs removing
+            with self.jobs_lock:
+                self.job_timers.pop(job_id, None)
+                self.store.remove(job_id)
+                self.metrics.forget_job(job_id)
+                self.log.info("cancel", "CANCELED: One-time job {job_id} finished and cancelled itself.",
+                              job_id=job_id, reason="finished")
+
+                # --- JOURNAL THE REMOVAL ---
+                self.persistence.journal_remove(job_id)
+                # --------------------------------------
+            # Outside jobs_lock: the mutation worker needs that lock to drain its queue
+            self.persist_jobs()
+
+    def fan_out_topics(self, job):
+        """
+        The topics a job publishes to, generated at fire time: one per device for a topic
+        template, the members of a named topic group, or just the job's own topic.
+        """
+        devices = job.get("devices")
+        if devices is not None:
+            template = job.get("topic")
+            return (template.replace(self.config.device_placeholder, device) for device in devices)
+        group = job.get("group")
+        if group is not None:
+            return iter(self.config.topic_groups.get(group, ()))
+        return iter((job.get("topic"),))
+
+    def publish_fan_out(self, job, job_id):
+        """Publishes one job's payload to every target it expands to, as one batch."""
+        payload, qos = job.get("payload"), job.get("qos", 0)
+        count = 0
+        for topic in self.fan_out_topics(job):
+            self.publish_status(topic, payload, qos)
+            count += 1
+        if count == 0:
+            self.log.error("fan_out", "[FAN-OUT ERROR] Job {job_id} has no targets (group {group!r} is empty or unknown)",
+                           job_id=job_id, group=job.get("group"))
+        else:
+            self.log.info("fan_out", "FAN-OUT: job {job_id} published '{payload}' to {count} topic(s)",
+                          job_id=job_id, payload=payload, count=count)
+
+    def _validate_targets(self, job_data):
+        """Returns an error message if a job's topic, or a fan-out job's devices or group, are unusable, otherwise None."""
+        devices, group = job_data.get("devices"), job_data.get("group")
+        placeholder = self.config.device_placeholder
+        if devices is not None and group is not None:
+            return "a job can target devices or a group, not both"
+        if devices is not None:
+            if not isinstance(devices, list) or not devices or not all(isinstance(d, str) and d for d in devices):
+                return "devices must be a non-empty list of device names"
+            if placeholder not in str(job_data.get("topic")):
+                return f"a job with devices needs a topic template containing {placeholder}"
+            # The template and every device name end up in the topics published at fire time
+            targets = [job_data["topic"], *devices]
+        elif group is not None:
+            if group not in self.config.topic_groups:
+                return f"unknown topic group {group!r}"
+            targets = self.config.topic_groups[group]
+        else:
+            targets = [job_data.get("topic")]
+        for target in targets:
+            error = _topic_error(target)
+            if error:
+                return error
+        return None
+
+    def _create_schedule_job(self, job_id, job_data, announce=True):
+        """Helper to register a job with the timer engine. Returns the timer handle, or None if the job is invalid."""
+        schedule_type = job_data.get("type")
+        topic = job_data.get("topic")
+        payload = job_data.get("payload")
+        time_value = job_data.get("time")
+        qos = job_data.get("qos", 0)
+
+        if qos not in (0, 1, 2):
+            self.log.warning("submit", "INVALID JOB: qos must be 0, 1 or 2, got {qos!r}", job_id=job_id, qos=qos)
+            return None
+        if not isinstance(payload, (str, bytes, int, float)):
+            self.log.warning("submit", "INVALID JOB: payload must be a string or a number, got {kind}",
+                             job_id=job_id, kind=type(payload).__name__)
+            return None
+
+        target_error = self._validate_targets(job_data)
+        if target_error:
+            self.log.warning("submit", "INVALID JOB: {reason}", job_id=job_id, reason=target_error)
+            return None
+        if job_data.get("devices") is not None:
+            topic = f"{topic} x {len(job_data['devices'])} devices"
+        elif job_data.get("group") is not None:
+            topic = f"group '{job_data['group']}'"
+
+        # Jobs sharing a fire time are spread out by a per-job offset that is stable across restarts
+        offset = jitter_offset(job_id, self.config.fire_jitter_seconds)
+
+        # Register the job with the timer engine; the job ID tag is what _fire_job receives
+        if schedule_type == "daily" and isinstance(time_value, str):
+            handle = self.timers.every_day_at(time_value, self._job_callback, tag=job_id, offset=offset)
+            description = "SCHEDULED DAILY at {at}: publish '{payload}' to {topic} (id {job_id})"
+        elif schedule_type == "interval" and isinstance(time_value, (int, float)) and not isinstance(time_value, bool):
+            handle = self.timers.every(time_value, self._job_callback, tag=job_id, offset=offset)
+            description = "SCHEDULED INTERVAL ({at} seconds): publish '{payload}' to {topic} (id {job_id})"
+        elif schedule_type == "once" and isinstance(time_value, str):
+            handle = self.timers.once_at(time_value, self._job_callback, tag=job_id, offset=offset)
+            description = "SCHEDULED ONCE at {at}: publish '{payload}' to {topic}. Will self-cancel. (id {job_id})"
+        else:
+            self.log.warning("submit", "INVALID JOB: unsupported type/time combination ({type!r}, {at!r})",
+                             job_id=job_id, type=schedule_type, at=time_value)
+            return None
+
+        if announce:
+            self.log.info("submit", description, job_id=job_id, status="scheduled", type=schedule_type,
+                          topic=topic, payload=payload, at=time_value)
+        self.job_timers[job_id] = handle
+        return handle
+
+    def add_job(self, job_data, job_id=None, announce=True):
+        """
+        Indexes and schedules a job. Returns (job_id, None) on success or (job_id, reason)
+        when the job is a duplicate or cannot be scheduled. Pass `job_id` if it is already known.
+        """
+        try:
+            stored_id = self.store.add(job_data, job_id)
+        except ValueError as e:
+            self.log.warning("submit", "INVALID JOB: {reason}", reason=str(e))
+            return job_id or make_job_id(job_data), "invalid"
+        if stored_id is None:
+            return job_id or make_job_id(job_data), "duplicate"
+        job_id = stored_id
+
+        try:
+            handle = self._create_schedule_job(job_id, job_data, announce)
+        except ValueError as e:
+            self.log.warning("submit", "INVALID JOB: {reason}", job_id=job_id, reason=str(e))
+            handle = None
+
+        if handle is None:
+            self.store.remove(job_id)
+            return job_id, "invalid"
+        return job_id, None
+
+    def submit_job_batch(self, entries):
+        """
+        Registers every valid entry in one pass and persists them with a single group commit.
+        Returns one result dict per entry, in submission order.
+        """
+        results = []
+        accepted = 0
+
+        for index, (job_data, error) in enumerate(entries):
+            if error is None and not _is_complete(job_data):
+                error = "Job data is incomplete"
+            if error:
+                results.append({"index": index, "status": "error", "message": error})
+                continue
+
+            job_id, rejected = self.add_job(job_data)
+            if rejected == "duplicate":
+                results.append({"index": index, "status": "duplicate", "job_id": job_id})
+            elif rejected:
+                results.append({"index": index, "status": "error", "message": "Invalid job type, time, topic, payload or qos", "job_id": job_id})
+            else:
+                self.persistence.journal_add(job_data, job_id)
+                accepted += 1
+                results.append({"index": index, "status": "accepted", "job_id": job_id})
+
+        if accepted:
+            self.persist_jobs()
+        return results
+
+    def remove_job(self, job_id):
+        """Cancels a job's timer and drops it from the index. Returns the removed job data, or None."""
+        handle = self.job_timers.pop(job_id, None)
+        if handle is not None:
+            self.timers.cancel(handle)
+        self.metrics.forget_job(job_id)
+        return self.store.remove(job_id)
+
+    # -----------------------------------------------------------------
+    # MQTT callbacks
+    # -----------------------------------------------------------------
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self.log.error("connect", "Failed to connect, return code {rc}", rc=reason_code.value)
+            return
+        self.log.info("connect", "Connected to MQTT Broker {broker}!", broker=self.name)
+        self.reset_topic_aliases(client, properties)
+        config = self.config
+
+        if config.serve_requests:
+            # Subscribe to control topic for job submissions
+            client.subscribe(shared_topic(config.control_topic, config.shared_subscription_group))
+            self.log.info("connect", "Subscribed to control topic: {topic}",
+                          topic=shared_topic(config.control_topic, config.shared_subscription_group))
+
+            # Subscribe to ping topic for health checks
+            client.subscribe(shared_topic(config.ping_topic, config.shared_subscription_group))
+            self.log.info("connect", "Subscribed to ping topic: {topic}",
+                          topic=shared_topic(config.ping_topic, config.shared_subscription_group))
+
+            # Subscribe to list jobs topic
+            client.subscribe(config.list_jobs_topic)
+            self.log.info("connect", "Subscribed to list jobs topic: {topic}", topic=config.list_jobs_topic)
+
+            # Subscribe to job management topics
+            client.subscribe(config.cancel_job_topic)
+            client.subscribe(config.update_job_topic)
+            self.log.info("connect", "Subscribed to job management topics: {cancel}, {update}",
+                          cancel=config.cancel_job_topic, update=config.update_job_topic)
+
+            # Subscribe to the recent events query topic
+            client.subscribe(config.events_topic)
+            self.log.info("connect", "Subscribed to events topic: {topic}", topic=config.events_topic)
+
+            # Publish initial status message
+            status_msg = json.dumps({
+                "status": "online",
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "active_jobs": len(self.store)
+            })
+            client.publish(config.status_topic, status_msg, retain=True)
+            self.log.info("connect", "Published online status to {topic}", topic=config.status_topic)
+
+        # Send what was fired while we were offline, at outbox_replay_rate
+        self.start_outbox_replay()
+
+    def start_outbox_replay(self, publisher=None):
+        """Replays the outbox on `publisher` (a pooled connection) or the main client once it has connected."""
+        if self.outbox.depth:
+            self.log.info("outbox", "[OUTBOX] Replaying {depth} message(s) fired while disconnected.", depth=self.outbox.depth)
+            self.outbox.start_replay(lambda topic, payload, qos, retain:
+                                     self._replay_publish(topic, payload, qos, retain, publisher))
+
+    def list_jobs_page(self, request):
+        """
+        Returns one page of jobs matching the request filters. The cursor says where to resume
+        (see JobStore.cursor_after()); "next_cursor" is None once the last page has been sent.
+        """
+        limit = max(1, min(int(request.get("limit", self.config.list_page_size)), self.config.list_max_page_size))
+        cursor = request.get("cursor") or 0
+
+        total_jobs = len(self.store)
+        page = []
+        last = None  # (position, record) of the last job looked at
+        for position, job_id, job in self.store.iter_from(cursor):
+            if len(page) >= limit:
+                break
+            last = position, job
+            if _job_matches(job, request):
+                page.append({"id": job_id, **job})
+        next_cursor = None
+        if last is not None and last[0] + 1 < total_jobs:
+            next_cursor = self.store.cursor_after(*last)
+
+        return {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "epoch": self.store.epoch,
+            "version": self.store.version,
+            "total_jobs": total_jobs,
+            "count": len(page),
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "jobs": page
+        }
+
+    def list_jobs_delta(self, request):
+        """
+        Answers a list request carrying "since_version" (and the "epoch" it came from):
+        "not_modified" if nothing changed, the jobs added and IDs removed since then, or
+        "resync_required" when the client must fetch a full listing again.
+        """
+        reply = {"epoch": self.store.epoch, "version": self.store.version}
+        since = request.get("since_version")
+        changes = None
+        if request.get("epoch") == self.store.epoch and isinstance(since, int):
+            changes = self.store.changes_since(since)
+        if changes is None or len(changes[0]) + len(changes[1]) > self.config.list_max_page_size:
+            return {"status": "resync_required", **reply}
+
+        added_ids, removed_ids = changes
+        if not added_ids and not removed_ids:
+            return {"status": "not_modified", **reply}
+        added = []
+        for job_id in added_ids:
+            job = self.store.record(job_id)
+            if _job_matches(job, request):
+                added.append({"id": job_id, **job})
+        return {"status": "delta", **reply, "since_version": since, "added": added, "removed": removed_ids}
+
+    def list_jobs_response(self, request):
+        """
+        Serialized reply to a list request. Pages are cached until the job store next
+        changes, so repeated requests for an unchanged list skip the JSON encoding.
+        """
+        if "since_version" in request:
+            return json.dumps(self.list_jobs_delta(request), separators=(",", ":"))
+
+        version = (self.store.epoch, self.store.version)
+        if self._list_cache_version != version:
+            self._list_cache.clear()
+            self._list_cache_version = version
+        key = json.dumps([request.get(name) for name in
+                          ("limit", "cursor", "topic_prefix", "type", "time_from", "time_to")])
+        response = self._list_cache.get(key)
+        if response is None:
+            response = json.dumps(self.list_jobs_page(request), separators=(",", ":"))
+            if len(self._list_cache) >= self.config.list_cache_entries:
+                self._list_cache.pop(next(iter(self._list_cache)))
+            self._list_cache[key] = response
+        return response
+
+    def answer_ping(self, client, raw_payload):
+        """
+        Sends the pong. It only reads counters, never the job store itself, and needs no
+        jobs_lock, so a large batch or a slow commit never delays a health check.
+        """
+        try:
+            text, correlation_id, reply_topic = _parse_ping(raw_payload)
+            self.log.info("ping", "Received PING request: '{text}'", text=text)
+
+            # Prepare pong response with status information
+            pong = {
+                "status": "alive",
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "active_jobs": len(self.job_timers),
+                "total_persistent_jobs": len(self.store),
+                "ping_received": text if text else "ping",
+                "outbox_depth": self.outbox.depth,
+                "metrics": self.metrics.summary()
+            }
+            if correlation_id is not None:
+                pong["id"] = correlation_id
+
+            reply_topic = reply_topic or self.config.status_topic
+            client.publish(reply_topic, json.dumps(pong))
+            self.log.info("ping", "Sent PONG response to {reply_topic}", reply_topic=reply_topic)
+
+        except Exception as e:
+            self.log.error("ping", "ERROR handling ping: {error}", error=str(e))
+
+    def answer_events_query(self, client, raw_payload):
+        """
+        Replies with recent events from the ring buffer. Like a ping it needs no jobs_lock.
+        The payload is empty or a JSON object of filters: limit, event, level, since, job_id, reply_to.
+        """
+        try:
+            request = _parse_list_request(raw_payload)
+            limit = max(1, min(int(request.get("limit", 100)), self.config.recent_events_size))
+            events = self.log.recent(limit, request.get("event"), request.get("level"), request.get("since"),
+                                     request.get("job_id"))
+            reply_topic = request.get("reply_to") or self.config.status_topic
+            client.publish(reply_topic, json.dumps({
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "count": len(events),
+                "log": self.log.stats(),
+                "events": events
+            }, default=str, separators=(",", ":")))
+            self.log.info("events", "Sent {count} recent event(s) to {reply_topic}", count=len(events), reply_topic=reply_topic)
+        except Exception as e:
+            self.log.error("events", "ERROR handling events request: {error}", error=str(e))
+
+    # -----------------------------------------------------------------
+    # Job mutations: each topic has a parser, which validates the payload on the network
+    # thread, and an apply function, which changes the job store and replies once durable.
+    # -----------------------------------------------------------------
+
+    def parse_submit(self, raw_payload):
+        """Returns a batch of (job_data, error) entries or a single job dict, or None if the payload is invalid."""
+        text = raw_payload.decode('utf-8').strip()
+        try:
+            # --- BULK SUBMISSION (JSON array or one job per line) ---
+            entries = _parse_job_batch(text)
+            if entries is not None:
+                self.metrics.record_submissions(len(entries))
+                return entries
+            job_data = json.loads(text)
+        except json.JSONDecodeError:
+            self.log.error("submit", "ERROR: Failed to decode JSON from topic {topic}. Payload: {payload}",
+                           topic=self.config.control_topic, payload=raw_payload)
+            return None
+
+        self.metrics.record_submissions()
+        if not _is_complete(job_data):
+            self.log.error("submit", "ERROR: Job data is incomplete.", job=job_data)
+            return None
+        return job_data
+
+    def apply_submit(self, command):
+        if isinstance(command, list):
+            results = self.submit_job_batch(command)
+
+            counts = {"accepted": 0, "duplicate": 0, "error": 0}
+            for result in results:
+                counts[result["status"]] += 1
+            self.reply_after_commit({
+                "status": "batch",
+                "total": len(results),
+                "accepted": counts["accepted"],
+                "duplicates": counts["duplicate"],
+                "errors": counts["error"],
+                "results": results
+            })
+            self.log.info("submit", "Received Batch of {total} Job Request(s): {accepted} accepted, "
+                                    "{duplicates} duplicate(s), {errors} error(s).",
+                          status="batch", total=len(results), accepted=counts["accepted"],
+                          duplicates=counts["duplicate"], errors=counts["error"])
+            return
+
+        job_data = command
+
+        # --- CHECK FOR DUPLICATE JOBS AND REGISTER ---
+        # The job ID is derived from (type, topic, payload, time), so a duplicate is a single index lookup
+        job_id, rejected = self.add_job(job_data)
+
+        if rejected == "duplicate":
+            # Queued behind the acks still waiting for the group commit, so replies stay in order
+            self.reply_after_commit({"status": "error", "message": "DUPLICATE JOB DETECTED - Job already exists in schedule!",
+                                     "job_id": job_id})
+            self.log.warning("submit", "DUPLICATE JOB DETECTED - Skipping job already in schedule. Type: {type}, "
+                                       "Topic: {topic}, Payload: {payload}, Time: {at}",
+                             job_id=job_id, status="duplicate", type=job_data.get("type"), topic=job_data.get("topic"),
+                             payload=job_data.get("payload"), at=job_data.get("time"))
+            return
+        if rejected:
+            self.reply_after_commit({"status": "error", "message": "Invalid job type, time, topic, payload or qos", "job_id": job_id})
+            return
+        # --------------------------------
+
+        # Journal the new job
+        self.persistence.journal_add(job_data, job_id)
+        self.persist_jobs()
+        self.reply_after_commit({"status": "accepted", "job_id": job_id})
+
+    def apply_cancel(self, job_id):
+        """Cancels a job by ID: the payload is a job ID or {"id": "..."}."""
+        removed = self.remove_job(job_id)
+
+        if removed is None:
+            self.log.warning("cancel", "CANCEL: no job with id {job_id}", job_id=job_id)
+            # With shared subscriptions every instance sees the cancel; only the one holding the job answers
+            if not self.config.shared_subscription_group:
+                self.reply_after_commit({"status": "error", "message": "Job not found", "job_id": job_id})
+            return
+
+        self.persistence.journal_remove(job_id)
+        self.persist_jobs()
+        self.log.info("cancel", "CANCELED job {job_id}: {job}", job_id=job_id, job=removed)
+        self.reply_after_commit({"status": "cancelled", "job_id": job_id})
+
+    def apply_update(self, changes):
+        job_id = changes.pop("id", None)
+        old_job = self.store.get(job_id)
+
+        if old_job is None:
+            self.log.warning("update", "UPDATE: no job with id {job_id}", job_id=job_id)
+            if not self.config.shared_subscription_group:
+                self.reply_after_commit({"status": "error", "message": "Job not found", "job_id": job_id})
+            return
+
+        new_job = {**old_job, **{k: v for k, v in changes.items() if k in UPDATABLE_FIELDS}}
+        new_job = {k: v for k, v in new_job.items() if v is not None}
+        new_id = make_job_id(new_job)
+        if new_id != job_id and new_id in self.store:
+            self.reply_after_commit({"status": "error", "message": "DUPLICATE JOB DETECTED - Updated job already exists in schedule!", "job_id": new_id})
+            return
+
+        # Swap the old job for the new one, restoring the old one if the new fields are invalid
+        self.remove_job(job_id)
+        new_id, rejected = self.add_job(new_job)
+        if rejected:
+            self.add_job(old_job)
+            self.reply_after_commit({"status": "error", "message": "Invalid job type, time, topic, payload or qos", "job_id": job_id})
+            return
+
+        self.persistence.journal_remove(job_id)
+        self.persistence.journal_add(new_job, new_id)
+        self.persist_jobs()
+        self.log.info("update", "UPDATED job {job_id} -> {new_job_id}", job_id=job_id, new_job_id=new_id)
+        self.reply_after_commit({"status": "updated", "old_job_id": job_id, "job_id": new_id})
+
+    def mutation_handler(self, topic):
+        """(parse, apply) for a topic that changes the job store, or None."""
+        if topic == self.config.control_topic:
+            return self.parse_submit, self.apply_submit
+        if topic == self.config.cancel_job_topic:
+            return _parse_job_id, self.apply_cancel
+        if topic == self.config.update_job_topic:
+            return _parse_update, self.apply_update
+        return None
+
+    def reject_request(self, topic, error):
+        """
+        Answers a job change whose payload could not be parsed. With the mutation worker the
+        reply is queued like a change, so it can't overtake acks still waiting for a commit.
+        """
+        self.log.error("message", "ERROR parsing message on {topic}: {error}", topic=topic, error=str(error))
+        # With shared subscriptions every instance sees cancels and updates; like "Job not found", none answers
+        if self.config.shared_subscription_group and topic != self.config.control_topic:
+            return
+        reply = {"status": "error", "message": f"Invalid request: {error}"}
+        if self.ingest is not None:
+            self.ingest.submit(self.reply_after_commit, reply)
+        else:
+            self.publish_reply(reply)
+
+    def ingest_message(self, msg):
+        """Validates a job mutation on the network thread and queues it for the mutation worker."""
+        if self._ignore_while_stopping(msg):
+            return
+        parse, apply = self.mutation_handler(msg.topic)
+        try:
+            command = parse(msg.payload)
+        except Exception as e:
+            self.reject_request(msg.topic, e)
+            return
+        if command is not None:
+            self.ingest.submit(apply, command)
+
+    def on_message(self, client, userdata, msg):
+        """Receives new job commands and ping requests."""
+
+        # Handle ping requests for health checks
+        if msg.topic == self.config.ping_topic:
+            self.answer_ping(client, msg.payload)
+
+        # Handle recent events queries
+        elif msg.topic == self.config.events_topic:
+            self.answer_events_query(client, msg.payload)
+
+        # Handle list jobs requests
+        elif msg.topic == self.config.list_jobs_topic:
+            try:
+                request = _parse_list_request(msg.payload)
+                reply_topic = request.get("reply_to") or self.config.status_topic
+                self.log.info("list", "Received LIST JOBS request")
+
+                # One compact page of matching jobs, or only the changes since the client's version
+                jobs_response = self.list_jobs_response(request)
+
+                client.publish(reply_topic, jobs_response)
+                self.log.info("list", "Sent job list ({size} bytes, version {version}) to {reply_topic}",
+                              size=len(jobs_response), version=self.store.version, reply_topic=reply_topic)
+
+            except Exception as e:
+                self.log.error("list", "ERROR handling list jobs request: {error}", error=str(e))
+
+        # Handle job submission, cancel and update requests
+        else:
+            handler = self.mutation_handler(msg.topic)
+            if handler is None:
+                return
+            parse, apply = handler
+            try:
+                command = parse(msg.payload)
+            except Exception as e:
+                self.reject_request(msg.topic, e)
+                return
+            try:
+                if command is not None:
+                    apply(command)
+            except Exception as e:
+                self.log.error("message", "ERROR handling message on {topic}: {error}", topic=msg.topic, error=str(e))
+
+    def _on_message_locked(self, client, userdata, msg):
+        """
+        Runs on_message while holding jobs_lock so it never races the timer thread. Pings and
+        events queries skip the lock, and job changes are handed to the mutation worker when it is running.
+        """
+        if msg.topic == self.config.ping_topic:
+            self.answer_ping(client, msg.payload)
+            return
+        if msg.topic == self.config.events_topic:
+            self.answer_events_query(client, msg.payload)
+            return
+        if self.ingest is not None and self.mutation_handler(msg.topic) is not None:
+            self.ingest_message(msg)
+            return
+        if self._ignore_while_stopping(msg):
+            return
+        with self.jobs_lock:
+            self.on_message(client, userdata, msg)
+
+    def _ignore_while_stopping(self, msg):
+        """stop() keeps the network running until the last acks are out; job changes arriving then are not applied."""
+        if self._stopping.is_set() and self.mutation_handler(msg.topic) is not None:
+            self.log.warning("message", "Stopping; ignored job change on {topic}", topic=msg.topic)
+            return True
+        return False
+
+    def _on_message_async(self, client, userdata, msg):
+        # Pings are answered straight from the network thread rather than waiting their turn on the
+        # loop, and job changes go to the mutation worker so commits never block the loop
+        if msg.topic == self.config.ping_topic:
+            self.answer_ping(client, msg.payload)
+        elif msg.topic == self.config.events_topic:
+            self.answer_events_query(client, msg.payload)
+        elif self.ingest is not None and self.mutation_handler(msg.topic) is not None:
+            self.ingest_message(msg)
+        else:
+            self._event_loop.call_soon_threadsafe(self._on_message_locked, client, userdata, msg)
+
+    # -----------------------------------------------------------------
+    # Background features
+    # -----------------------------------------------------------------
+
+    def _attach_event_loop(self, event_loop):
+        """asyncio mode: fires go through a bounded dispatcher and inbound messages run on `event_loop`."""
+        self._event_loop = event_loop
+        config = self.config
+        self.dispatcher = PublishDispatcher(self.publishers.publish if self.publishers is not None else self._publish_now,
+                                            config.dispatch_queue_size, config.dispatch_max_inflight,
+                                            config.dispatch_overflow, limiter=self.limiter, bursts=self.bursts)
+        self.dispatcher.attach()
+        self.client.on_message = self._on_message_async
+
+    async def _run_asyncio(self):
+        """Runs the timer loop and the publisher side by side until the timer loop stops."""
+        publisher = asyncio.create_task(self.dispatcher.run())
+        try:
+            await self.timers.run_async(before_fire=self.dispatcher.wait_for_space)
+        finally:
+            publisher.cancel()
+
+    def reload_schedule_file(self):
+        """
+        Applies an external edit of the schedule file to the running scheduler. The file is
+        diffed against the live job index and only added and removed jobs are touched, so
+        every other job keeps its timer. Returns a summary dict, or None if the file is unchanged.
+        """
+        jobs = self.persistence.read_changed_snapshot()
+        if jobs is None:
+            return None
+
+        # Hash the file's jobs before taking the lock, so firing is only paused for the diff itself
+        started = time.perf_counter()
+        file_jobs = {make_job_id(job): job for job in jobs if isinstance(job, dict)}
+        parsed = time.perf_counter()
+
+        with self.jobs_lock:
+            # Jobs changed over MQTT since the snapshot was written aren't in the file; leave them be
+            added_since, removed_since = self.persistence.changes_since_snapshot()
+            to_remove = self.store.ids() - file_jobs.keys() - added_since
+            new_ids = file_jobs.keys() - self.store.ids() - removed_since
+            to_add = [(job_id, job) for job_id, job in file_jobs.items() if job_id in new_ids]  # Keep file order
+
+            for job_id in to_remove:
+                self.remove_job(job_id)
+            added, invalid = [], 0
+            for job_id, job in to_add:
+                if _is_complete(job) and self.add_job(job, job_id)[1] is None:
+                    added.append(job)
+                else:
+                    invalid += 1
+            # Nothing to journal: the edited file already holds these changes, and replaying the
+            # older journal records on top of it at startup gives the same job set as now
+            applied = time.perf_counter()
+
+        summary = {
+            "status": "reloaded",
+            "added": len(added),
+            "removed": len(to_remove),
+            "invalid": invalid,
+            "total_jobs": len(self.store),
+            "diff_ms": round((parsed - started) * 1000, 3),
+            "apply_ms": round((applied - parsed) * 1000, 3),
+            "total_ms": round((applied - started) * 1000, 3),
+        }
+        self.metrics.record_reload(summary)
+        self.log.info("reload", "[RELOAD] Applied edit of schedule file: +{added} -{removed} ({invalid} invalid) "
+                                "in {total_ms} ms", **{key: summary[key] for key in ("added", "removed", "invalid", "total_ms")})
+        self.publish_reply(dict(summary))
+        return summary
+
+    def watch_schedule_file(self):
+        """Polls the schedule file every hot_reload_interval seconds until the engine stops."""
+        while not self._stopping.wait(self.config.hot_reload_interval):
+            try:
+                self.reload_schedule_file()
+            except Exception as e:
+                self.log.error("reload", "[RELOAD ERROR] Could not apply schedule file changes: {error}", error=str(e))
+
+    def _make_publisher_client(self, index):
+        """Creates one pooled publisher connection."""
+        publisher = self._new_client()
+        publisher.on_connect = self._on_publisher_connect
+        if self.config.username and self.config.password:
+            publisher.username_pw_set(self.config.username, self.config.password)
+        return publisher
+
+    def _on_publisher_connect(self, client, userdata, flags, reason_code, properties):
+        """
+        A pooled connection fires most job messages, so the ones it could not send wait in the
+        outbox; replay them as soon as it (re)connects, even if the main client never dropped.
+        """
+        if reason_code.is_failure:
+            return
+        self.reset_topic_aliases(client, properties)
+        self.start_outbox_replay(client)
+
+    def start_burst_smoothing(self):
+        """Creates the rate limiter and publisher pool when the publish_* settings ask for them."""
+        config = self.config
+        self.limiter = RateLimiter(config.publish_rate_limit, config.publish_burst, config.prefix_rate_limits)
+        if not self.limiter:
+            self.limiter = None
+        threaded = config.runtime_mode == "threaded"
+        # In threaded mode a rate limit needs a pool, so the timer thread never sleeps on the limiter
+        pool_size = config.publish_pool_size or (1 if self.limiter is not None and threaded else 0)
+        if pool_size:
+            self.publishers = PublisherPool(
+                self._make_publisher_client, pool_size,
+                lambda publisher, topic, payload, qos, retain: self._publish_now(topic, payload, qos, retain, publisher),
+                limiter=self.limiter if threaded else None,  # The dispatcher applies it in asyncio mode
+                bursts=self.bursts if threaded else None)
+            self.publishers.start(config.broker_address, config.port, config.keepalive)
+            print(f"Publisher pool: {pool_size} connection(s), rate limit {config.publish_rate_limit or 'none'}")
+
+    def start_ingest(self):
+        """Starts the mutation worker when ingest_worker is set."""
+        config = self.config
+        if not config.ingest_worker:
+            return
+        self.ingest = MutationWorker(self.commit_jobs, self.publish_reply, config.ingest_queue_size,
+                                     config.ingest_commit_delay, config.ingest_max_batch,
+                                     lock=self.jobs_lock, on_latency=self.metrics.record_ingest)
+        self.ingest.start()
+        print(f"Mutation worker: group commit every {config.ingest_commit_delay * 1000:.0f} ms, "
+              f"queue {config.ingest_queue_size}")
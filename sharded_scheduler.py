@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Sharded MQTT scheduler.
+
+A coordinator process owns the control, ping, list, cancel and update topics and
+routes every job to one of N worker processes by a hash of its target topic. Each
+worker runs a SchedulerEngine with its own timer engine, MQTT connection
+and persistence shard (schedules.shard<N>.json / .journal). Ping and list requests
+are answered by aggregating across all shards.
+
+Usage:
+    python sharded_scheduler.py --shards 4
+    python sharded_scheduler.py --shards 4 --config scheduler.json
+"""
+import paho.mqtt.client as mqtt
+import argparse
+import itertools
+import json
+import multiprocessing
+import time
+import zlib
+from datetime import datetime
+
+from scheduler_engine import (SchedulerConfig, SchedulerEngine, UPDATABLE_FIELDS, _is_complete, _parse_job_batch,
+                              _parse_list_request, _parse_job_id, _parse_ping, _parse_update)
+from job_store import make_job_id
+from mqtt5 import shared_topic
+
+SHARD_COUNT = 4
+SHARD_TIMEOUT = 5  # Seconds to wait for a worker before treating it as unresponsive
+
+
+def shard_for_topic(topic, shard_count):
+    """Stable shard index for a topic (crc32, so it is the same in every process and across restarts)."""
+    return zlib.crc32(str(topic).encode('utf-8')) % shard_count
+
+
+# =================================================================
+# --- WORKER PROCESS ---
+# =================================================================
+
+def _worker_handle(engine, op, arg):
+    """Applies one coordinator request to this worker's job store. Caller holds the engine's jobs_lock."""
+    if op == "submit_batch":
+        return engine.submit_job_batch(arg)
+    if op == "get":
+        return engine.store.get(arg)
+    if op == "remove":
+        removed = engine.remove_job(arg)
+        if removed is not None:
+            engine.persistence.journal_remove(arg)
+            engine.commit_jobs()
+        return removed
+    if op == "list":
+        return engine.list_jobs_page(arg)
+    if op == "events":
+        return engine.log.recent(arg.get("limit", 100), arg.get("event"), arg.get("level"), arg.get("since"),
+                                 arg.get("job_id"))
+    if op == "status":
+        return {
+            "active_jobs": len(engine.job_timers),
+            "total_persistent_jobs": len(engine.store),
+            "outbox_depth": engine.outbox.depth,
+            "metrics": engine.metrics.summary(),
+        }
+    raise ValueError(f"Unknown shard operation '{op}'")
+
+
+def worker_main(shard_index, conn, settings):
+    """Entry point of a worker process: one scheduler shard driven by requests on `conn`."""
+    config = SchedulerConfig(**settings)
+    config.schedule_file = f"schedules.shard{shard_index}.json"
+    config.journal_file = f"schedules.shard{shard_index}.journal"
+    config.outbox_file = f"outbox.shard{shard_index}.jsonl"
+    config.metrics_topic = f"{config.metrics_topic}/shard/{shard_index}"
+    # Workers only publish; the coordinator owns every inbound topic and commits each request itself
+    config.serve_requests = False
+    config.ingest_worker = False
+
+    # Each shard gets its own publisher pool and rate limiter, so configured rates apply per shard
+    engine = SchedulerEngine(config, name=f"shard {shard_index}")
+    engine.start()
+
+    while True:
+        try:
+            seq, op, arg = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        try:
+            if op in ("status", "events"):
+                # Counters and the event ring buffer only, so a health check never waits behind a commit on the timer thread
+                result = _worker_handle(engine, op, arg)
+            else:
+                with engine.jobs_lock:
+                    result = _worker_handle(engine, op, arg)
+            conn.send((seq, True, result))
+        except Exception as e:
+            conn.send((seq, False, str(e)))
+
+    engine.stop()
+
+
+# =================================================================
+# --- COORDINATOR ---
+# =================================================================
+
+class Coordinator:
+    """Owns the inbound topics and fans requests out to the shard workers."""
+
+    def __init__(self, shard_count, config=None):
+        self.shard_count = shard_count
+        self.config = config or SchedulerConfig()
+        self._conns = []
+        self._workers = []
+        self._seq = itertools.count()
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                                  protocol=mqtt.MQTTv5 if self.config.mqtt5 else mqtt.MQTTv311)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def start_workers(self):
+        # "spawn" starts every worker from a fresh interpreter rather than a copy of the coordinator
+        context = multiprocessing.get_context("spawn")
+        for shard_index in range(self.shard_count):
+            parent_conn, child_conn = context.Pipe()
+            worker = context.Process(target=worker_main, args=(shard_index, child_conn, self.config.to_dict()),
+                                     name=f"scheduler-shard-{shard_index}", daemon=True)
+            worker.start()
+            self._conns.append(parent_conn)
+            self._workers.append(worker)
+        print(f"Started {self.shard_count} shard worker(s).")
+
+    # -----------------------------------------------------------------
+    # Requests to workers
+    # -----------------------------------------------------------------
+
+    def _send(self, shard_index, op, arg=None):
+        seq = next(self._seq)
+        self._conns[shard_index].send((seq, op, arg))
+        return seq
+
+    def _receive(self, shard_index, seq):
+        """Waits for the reply to `seq`, discarding late replies to earlier timed-out requests."""
+        conn = self._conns[shard_index]
+        deadline = time.monotonic() + SHARD_TIMEOUT
+        while conn.poll(max(0.0, deadline - time.monotonic())):
+            reply_seq, ok, result = conn.recv()
+            if reply_seq == seq:
+                if not ok:
+                    raise RuntimeError(f"Shard {shard_index}: {result}")
+                return result
+        raise TimeoutError(f"Shard {shard_index} did not answer within {SHARD_TIMEOUT} seconds")
+
+    def call(self, shard_index, op, arg=None):
+        return self._receive(shard_index, self._send(shard_index, op, arg))
+
+    def broadcast(self, op, arg=None):
+        """Sends the same request to every shard in parallel. Returns one result (or exception) per shard."""
+        pending = [(shard_index, self._send(shard_index, op, arg)) for shard_index in range(self.shard_count)]
+        results = []
+        for shard_index, seq in pending:
+            try:
+                results.append(self._receive(shard_index, seq))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # -----------------------------------------------------------------
+    # Request handlers
+    # -----------------------------------------------------------------
+
+    def publish_reply(self, reply, topic=None, retain=False):
+        reply["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.client.publish(topic or self.config.status_topic, json.dumps(reply), retain=retain)
+
+    def submit(self, entries):
+        """Routes each entry to its shard, one batch per shard, and merges the results in submission order."""
+        results = [None] * len(entries)
+        per_shard = {}
+        for index, (job_data, error) in enumerate(entries):
+            if error is None and not _is_complete(job_data):
+                error = "Job data is incomplete"
+            if error:
+                results[index] = {"index": index, "status": "error", "message": error}
+                continue
+            # Group fan-out jobs have no topic of their own, so they are routed by group name
+            shard_index = shard_for_topic(job_data.get("topic") or job_data.get("group"), self.shard_count)
+            per_shard.setdefault(shard_index, []).append((index, job_data))
+
+        pending = [(shard_index, items, self._send(shard_index, "submit_batch", [(job, None) for _, job in items]))
+                   for shard_index, items in per_shard.items()]
+        for shard_index, items, seq in pending:
+            try:
+                shard_results = self._receive(shard_index, seq)
+            except Exception as e:
+                shard_results = [{"status": "error", "message": str(e)} for _ in items]
+            for (index, _), result in zip(items, shard_results):
+                results[index] = {**result, "index": index}
+        return results
+
+    def handle_submit(self, payload):
+        text = payload.decode('utf-8').strip()
+        entries = _parse_job_batch(text)
+        if entries is not None:
+            results = self.submit(entries)
+            counts = {"accepted": 0, "duplicate": 0, "error": 0}
+            for result in results:
+                counts[result["status"]] += 1
+            self.publish_reply({
+                "status": "batch",
+                "total": len(results),
+                "accepted": counts["accepted"],
+                "duplicates": counts["duplicate"],
+                "errors": counts["error"],
+                "results": results
+            })
+            print(f"[COORDINATOR] Batch of {len(results)}: {counts['accepted']} accepted, "
+                  f"{counts['duplicate']} duplicate(s), {counts['error']} error(s).")
+            return
+
+        job_data = json.loads(text)
+        if not _is_complete(job_data):
+            print("ERROR: Job data is incomplete.")
+            return
+
+        result = self.submit([(job_data, None)])[0]
+        if result["status"] == "accepted":
+            self.publish_reply({"status": "accepted", "job_id": result["job_id"]})
+        elif result["status"] == "duplicate":
+            self.publish_reply({"status": "error",
+                                "message": "DUPLICATE JOB DETECTED - Job already exists in schedule!",
+                                "job_id": result["job_id"]}, retain=True)
+        else:
+            self.publish_reply({"status": "error", "message": result.get("message"), "job_id": result.get("job_id")})
+
+    def _find_job(self, job_id):
+        """Returns (shard_index, job_data) for a job ID, or (None, None). IDs don't encode the shard, so ask all."""
+        for shard_index, job in enumerate(self.broadcast("get", job_id)):
+            if isinstance(job, dict):
+                return shard_index, job
+        return None, None
+
+    def reject_request(self, error):
+        """Answers a cancel or update that could not be parsed (not in shared mode, as with "Job not found")."""
+        print(f"[COORDINATOR] ERROR: invalid request: {error}")
+        if not self.config.shared_subscription_group:
+            self.publish_reply({"status": "error", "message": f"Invalid request: {error}"})
+
+    def handle_cancel(self, payload):
+        try:
+            job_id = _parse_job_id(payload)
+        except ValueError as e:
+            self.reject_request(e)
+            return
+        shard_index, _ = self._find_job(job_id)
+        if shard_index is None or self.call(shard_index, "remove", job_id) is None:
+            # With shared subscriptions only the coordinator holding the job answers
+            if not self.config.shared_subscription_group:
+                self.publish_reply({"status": "error", "message": "Job not found", "job_id": job_id})
+            return
+        print(f"[COORDINATOR] CANCELED job {job_id} on shard {shard_index}")
+        self.publish_reply({"status": "cancelled", "job_id": job_id})
+
+    def handle_update(self, payload):
+        try:
+            changes = _parse_update(payload)
+        except ValueError as e:
+            self.reject_request(e)
+            return
+        job_id = changes.pop("id")
+        old_shard, old_job = self._find_job(job_id)
+        if old_job is None:
+            if not self.config.shared_subscription_group:
+                self.publish_reply({"status": "error", "message": "Job not found", "job_id": job_id})
+            return
+
+        new_job = {**old_job, **{k: v for k, v in changes.items() if k in UPDATABLE_FIELDS}}
+        new_job = {k: v for k, v in new_job.items() if v is not None}
+        new_id = make_job_id(new_job)
+        if new_id != job_id and self._find_job(new_id)[1] is not None:
+            self.publish_reply({"status": "error", "message": "DUPLICATE JOB DETECTED - Updated job already exists in schedule!",
+                                "job_id": new_id})
+            return
+
+        # The new topic may hash to a different shard, so remove from the old one and submit to the new one
+        self.call(old_shard, "remove", job_id)
+        result = self.submit([(new_job, None)])[0]
+        if result["status"] != "accepted":
+            self.submit([(old_job, None)])
+            self.publish_reply({"status": "error", "message": "Invalid job type, time, topic, payload or qos", "job_id": job_id})
+            return
+        self.publish_reply({"status": "updated", "old_job_id": job_id, "job_id": new_id})
+
+    def handle_ping(self, payload):
+        text, correlation_id, reply_topic = _parse_ping(payload)
+        shards = []
+        active = persistent = outbox_depth = 0
+        for shard_index, status in enumerate(self.broadcast("status")):
+            if isinstance(status, Exception):
+                shards.append({"shard": shard_index, "status": "unresponsive"})
+                continue
+            active += status["active_jobs"]
+            persistent += status["total_persistent_jobs"]
+            outbox_depth += status["outbox_depth"]
+            shards.append({"shard": shard_index, "status": "alive", **status})
+
+        alive = all(shard["status"] == "alive" for shard in shards)
+        pong = {
+            "status": "alive" if alive else "degraded",
+            "active_jobs": active,
+            "total_persistent_jobs": persistent,
+            "ping_received": text if text else "ping",
+            "outbox_depth": outbox_depth,
+            "shards": shards
+        }
+        if correlation_id is not None:
+            pong["id"] = correlation_id
+        self.publish_reply(pong, topic=reply_topic)
+
+    def handle_events(self, payload):
+        """Merges every shard's recent events by time and keeps the newest `limit`."""
+        request = _parse_list_request(payload)
+        request["limit"] = max(1, min(int(request.get("limit", 100)), self.config.recent_events_size))
+        events = []
+        for shard_index, shard_events in enumerate(self.broadcast("events", request)):
+            if not isinstance(shard_events, Exception):
+                events.extend({**event, "shard": shard_index} for event in shard_events)
+        events.sort(key=lambda event: event["time"])
+        events = events[-request["limit"]:]
+        self.client.publish(request.get("reply_to") or self.config.status_topic, json.dumps({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "count": len(events),
+            "events": events
+        }, default=str, separators=(",", ":")))
+
+    def handle_list(self, payload):
+        """Walks the shards in order. The cursor is "<shard>:<that shard's own cursor>"."""
+        request = _parse_list_request(payload)
+        reply_topic = request.get("reply_to") or self.config.status_topic
+        limit = max(1, min(int(request.get("limit", self.config.list_page_size)), self.config.list_max_page_size))
+
+        cursor = str(request.get("cursor") or "0:0")
+        shard_text, _, position = cursor.partition(":")
+        shard_index = int(shard_text) if position else 0
+
+        total_jobs = sum(status["total_persistent_jobs"] for status in self.broadcast("status")
+                         if not isinstance(status, Exception))
+        jobs = []
+        next_cursor = None
+        while shard_index < self.shard_count:
+            page = self.call(shard_index, "list", {**request, "limit": limit - len(jobs), "cursor": position})
+            jobs.extend(page["jobs"])
+            if page["next_cursor"] is not None:
+                next_cursor = f"{shard_index}:{page['next_cursor']}"
+                break
+            shard_index, position = shard_index + 1, 0
+            if len(jobs) >= limit:
+                next_cursor = f"{shard_index}:0" if shard_index < self.shard_count else None
+                break
+
+        self.client.publish(reply_topic, json.dumps({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total_jobs": total_jobs,
+            "count": len(jobs),
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "jobs": jobs
+        }, separators=(",", ":")))
+
+    # -----------------------------------------------------------------
+    # MQTT callbacks
+    # -----------------------------------------------------------------
+
+    def on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"Failed to connect, return code {reason_code.value}")
+            return
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Coordinator connected to MQTT Broker!")
+        # Several coordinators can split submissions and pings through a shared subscription
+        for topic in (self.config.control_topic, self.config.ping_topic):
+            client.subscribe(shared_topic(topic, self.config.shared_subscription_group))
+        for topic in (self.config.list_jobs_topic, self.config.cancel_job_topic, self.config.update_job_topic,
+                      self.config.events_topic):
+            client.subscribe(topic)
+        print(f"Subscribed to control, ping, list, cancel, update and events topics ({self.shard_count} shards)")
+
+    def on_message(self, client, userdata, msg):
+        handlers = {
+            self.config.control_topic: self.handle_submit,
+            self.config.ping_topic: self.handle_ping,
+            self.config.list_jobs_topic: self.handle_list,
+            self.config.cancel_job_topic: self.handle_cancel,
+            self.config.update_job_topic: self.handle_update,
+            self.config.events_topic: self.handle_events,
+        }
+        handler = handlers.get(msg.topic)
+        if handler is None:
+            return
+        try:
+            handler(msg.payload)
+        except json.JSONDecodeError:
+            print(f"ERROR: Failed to decode JSON from topic {msg.topic}. Payload: {msg.payload}")
+        except Exception as e:
+            print(f"ERROR handling {msg.topic}: {e}")
+
+    def run(self):
+        self.start_workers()
+        if self.config.username and self.config.password:
+            self.client.username_pw_set(self.config.username, self.config.password)
+        print(f"\nAttempting to connect to {self.config.broker_address}:{self.config.port}...")
+        self.client.connect(self.config.broker_address, self.config.port, self.config.keepalive)
+        try:
+            self.client.loop_forever()
+        except KeyboardInterrupt:
+            print("\nStopping coordinator...")
+        finally:
+            for conn in self._conns:
+                conn.close()
+            for worker in self._workers:
+                worker.join(timeout=SHARD_TIMEOUT)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MQTT scheduler as N sharded worker processes")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help=f"Number of worker processes (default {SHARD_COUNT})")
+    parser.add_argument("--config", metavar="FILE", help="JSON file of scheduler settings, as for mqtt_scheduler.py")
+    args = parser.parse_args()
+    config = SchedulerConfig()
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = SchedulerConfig(**json.load(f))
+    Coordinator(args.shards, config).run()
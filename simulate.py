@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Virtual-clock simulation of a schedule set, for capacity planning.
+
+Loads a schedule file the way the scheduler does at startup and fires every job with
+the real scheduling logic (the timer engine, jitter offsets, fan-out and one-time
+jobs), but on a virtual clock that jumps straight to the next deadline instead of
+waiting for it. A day of schedules replays in seconds. Nothing is published and
+no file is written; every publish is counted against the virtual second it fell in.
+
+Usage:
+    python simulate.py                                # schedules.json, today 00:00 to 24:00
+    python simulate.py --schedule-file new.json       # try a schedule before rolling it out
+    python simulate.py --config home.json --hours 48 --start "2026-03-29 00:00"
+    python simulate.py --output report.json           # also write the per-second load
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+from mqtt_scheduler import load_config
+from persistence import JobPersistence
+from scheduler_engine import SchedulerConfig, SchedulerEngine
+from timer_engine import TimerEngine
+
+# Upper bounds of the "publishes in one second" histogram buckets
+LOAD_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+TOP_SECONDS = 10  # Busiest seconds listed in the report
+
+
+class VirtualClock:
+    """A clock that only moves when the simulation moves it. Pass it to TimerEngine as `clock`."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class LoadRecorder:
+    """Stands in for paho's Client: counts every publish against the virtual second it happened in."""
+
+    def __init__(self, clock, start, seconds):
+        self._clock = clock
+        self._start = start
+        self.per_second = [0] * seconds
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.per_second[int(self._clock() - self._start)] += 1
+        return (mqtt.MQTT_ERR_SUCCESS, 0)
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+
+class _DiscardingPersistence(JobPersistence):
+    """One-time jobs journal their removal when they fire; a simulation must not touch the real files."""
+
+    def commit_schedules(self, snapshot_source=None):
+        with self._lock:
+            self._pending.clear()
+        return True
+
+
+# =================================================================
+# --- SIMULATION ---
+# =================================================================
+
+def simulate(jobs, config=None, start=None, hours=24):
+    """
+    Fires `jobs` (a list of job dicts) from `start` (epoch seconds, default today's local
+    midnight) for `hours` of virtual time. Interval jobs count from `start`, as if the
+    scheduler was started then. Returns the report dict; its "per_second" list holds the
+    publishes in every simulated second.
+    """
+    config = config or SchedulerConfig()
+    if start is None:
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    seconds = int(hours * 3600)
+    end = start + seconds
+
+    # Register just before `start`, so jobs due exactly at the start (e.g. daily at 00:00) fire in the window
+    clock = VirtualClock(start - 0.001)
+    recorder = LoadRecorder(clock, start, seconds)
+    # Per-publish log lines would dominate the run time; invalid jobs are still reported as warnings
+    engine = SchedulerEngine(SchedulerConfig(**{**config.to_dict(), "log_level": "warning"}),
+                             timers=TimerEngine(clock=clock), client=recorder, name="simulation")
+    engine.persistence = _DiscardingPersistence()
+
+    started = time.perf_counter()
+    rejected = {"duplicate": 0, "invalid": 0}
+    for job in jobs:
+        reason = engine.add_job(job, announce=False)[1]
+        if reason is not None:
+            rejected[reason] += 1
+    load_seconds = time.perf_counter() - started
+
+    # Jump from deadline to deadline; each run_pending() fires everything due at that instant
+    fires_per_second = [0] * seconds
+    started = time.perf_counter()
+    while True:
+        deadline = engine.timers.next_deadline()
+        if deadline is None or deadline >= end:
+            break
+        clock.now = max(deadline, start)
+        fires_per_second[int(clock.now - start)] += engine.timers.run_pending()
+    run_seconds = time.perf_counter() - started
+    engine.log.flush()
+
+    report = load_report(recorder.per_second, fires_per_second, start, config.publish_rate_limit)
+    report.update({
+        "jobs": len(jobs) - rejected["duplicate"] - rejected["invalid"],
+        "duplicates": rejected["duplicate"],
+        "invalid": rejected["invalid"],
+        "start": _timestamp(start),
+        "hours": hours,
+        "schedule_seconds": round(load_seconds, 3),
+        "simulation_seconds": round(run_seconds, 3),
+        "speedup": round(seconds / run_seconds) if run_seconds > 0 else None,
+        "per_second": recorder.per_second,
+    })
+    return report
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def load_report(per_second, fires_per_second, start, rate_limit=None):
+    """Peak, worst-minute, histogram and daily projection for a list of publishes per second."""
+    seconds = len(per_second)
+    publishes = sum(per_second)
+    fires = sum(fires_per_second)
+
+    # Distribution of seconds by how many messages went out in them
+    histogram = [0] * (len(LOAD_BUCKETS) + 1)
+    for count in per_second:
+        index = 0
+        while index < len(LOAD_BUCKETS) and count > LOAD_BUCKETS[index]:
+            index += 1
+        histogram[index] += 1
+    labels = [str(bound) if index == 0 or LOAD_BUCKETS[index - 1] + 1 == bound
+              else f"{LOAD_BUCKETS[index - 1] + 1}-{bound}" for index, bound in enumerate(LOAD_BUCKETS)]
+    labels.append(f">{LOAD_BUCKETS[-1]}")
+
+    # The simulation starts on a whole minute, so every 60 seconds is one clock minute
+    minutes = [sum(per_second[i:i + 60]) for i in range(0, seconds, 60)]
+    worst_minute = max(range(len(minutes)), key=minutes.__getitem__) if minutes else 0
+    minute_slice = per_second[worst_minute * 60:worst_minute * 60 + 60]
+
+    busiest = sorted(range(seconds), key=per_second.__getitem__, reverse=True)[:TOP_SECONDS]
+    peak_fire_second = max(range(seconds), key=fires_per_second.__getitem__) if seconds else 0
+
+    report = {
+        "fires": fires,
+        "publishes": publishes,
+        "peak_publishes_per_second": per_second[busiest[0]] if busiest else 0,
+        "peak_second": _timestamp(start + busiest[0]) if publishes else None,
+        "peak_fires_per_second": fires_per_second[peak_fire_second] if seconds else 0,
+        "idle_seconds": histogram[0],
+        "worst_minute": {
+            "minute": _timestamp(start + worst_minute * 60)[:-3],
+            "publishes": minutes[worst_minute] if minutes else 0,
+            "peak_per_second": max(minute_slice, default=0),
+            "busy_seconds": sum(1 for count in minute_slice if count),
+        },
+        "busiest_seconds": [{"second": _timestamp(start + s), "publishes": per_second[s]} for s in busiest
+                            if per_second[s]],
+        "histogram": dict(zip(labels, histogram)),
+        "hourly": [{"hour": _timestamp(start + i)[:-3], "publishes": sum(per_second[i:i + 3600]),
+                    "peak_per_second": max(per_second[i:i + 3600])} for i in range(0, seconds, 3600)],
+        "projected_daily_publishes": round(publishes * 86400 / seconds) if seconds else 0,
+        "average_publishes_per_second": round(publishes / seconds, 3) if seconds else 0,
+    }
+
+    # With a publish rate limit, bursts queue up; the backlog ignores publish_burst, so it is a worst case
+    if rate_limit:
+        backlog = worst_backlog = over = 0
+        worst_at = 0
+        for second, count in enumerate(per_second):
+            over += count > rate_limit
+            backlog = max(0, backlog + count - rate_limit)
+            if backlog > worst_backlog:
+                worst_backlog, worst_at = backlog, second
+        report["rate_limit"] = {
+            "publishes_per_second": rate_limit,
+            "seconds_over_limit": over,
+            "max_backlog": worst_backlog,
+            "max_backlog_at": _timestamp(start + worst_at) if worst_backlog else None,
+            "max_delay_seconds": round(worst_backlog / rate_limit, 1),
+        }
+    return report
+
+
+def print_report(report, schedule_file):
+    print(f"\nSimulated {report['hours']}h of {report['jobs']} job(s) from {schedule_file}, starting {report['start']}")
+    if report["duplicates"] or report["invalid"]:
+        print(f"  Skipped {report['duplicates']} duplicate(s) and {report['invalid']} invalid job(s)")
+    print(f"  Scheduled in {report['schedule_seconds']}s, simulated in {report['simulation_seconds']}s "
+          f"({report['speedup']}x real time)")
+
+    print(f"\nFires:                {report['fires']}")
+    print(f"Publishes:            {report['publishes']} ({report['average_publishes_per_second']}/s on average)")
+    print(f"Projected per day:    {report['projected_daily_publishes']}")
+    print(f"Peak fires/s:         {report['peak_fires_per_second']}")
+    peak_at = f" at {report['peak_second']}" if report["peak_second"] else ""
+    print(f"Peak publishes/s:     {report['peak_publishes_per_second']}{peak_at}")
+    worst = report["worst_minute"]
+    print(f"Worst minute:         {worst['minute']}: {worst['publishes']} publishes, "
+          f"peak {worst['peak_per_second']}/s, {worst['busy_seconds']} busy second(s)")
+    if "rate_limit" in report:
+        limit = report["rate_limit"]
+        backlog_at = f" at {limit['max_backlog_at']}" if limit["max_backlog_at"] else ""
+        print(f"Rate limit {limit['publishes_per_second']}/s:   {limit['seconds_over_limit']} second(s) over, "
+              f"max backlog {limit['max_backlog']} ({limit['max_delay_seconds']}s delay){backlog_at}")
+
+    print("\nPublishes/s  Seconds")
+    for label, count in report["histogram"].items():
+        if count:
+            print(f"  {label:>10}  {count}")
+
+    print("\nBusiest seconds")
+    for entry in report["busiest_seconds"]:
+        print(f"  {entry['second']}  {entry['publishes']}")
+
+    print("\nHour              Publishes  Peak/s")
+    for entry in report["hourly"]:
+        print(f"  {entry['hour']}  {entry['publishes']:>9}  {entry['peak_per_second']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a schedule file on a virtual clock and report its load.")
+    parser.add_argument("--config", metavar="FILE", help="JSON file of scheduler settings, as for mqtt_scheduler.py")
+    parser.add_argument("--schedule-file", help="Schedule to simulate, overriding the config (its .journal is read too, if any)")
+    parser.add_argument("--hours", type=float, default=24, help="Virtual hours to simulate (default 24)")
+    parser.add_argument("--start", help='Virtual start time "YYYY-MM-DD HH:MM" (default today 00:00)')
+    parser.add_argument("--output", help="Also write the report, with the publishes in every second, as JSON")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    if args.schedule_file:
+        overrides["schedule_file"] = args.schedule_file
+        # schedules.json is journaled to schedules.journal, so new.json to new.journal
+        overrides["journal_file"] = os.path.splitext(args.schedule_file)[0] + ".journal"
+    try:
+        config = load_config(args.config, overrides) if args.config else SchedulerConfig(**overrides)
+    except (IOError, json.JSONDecodeError, TypeError) as e:
+        print(f"Could not load config: {e}")
+        return 1
+    try:
+        start = datetime.strptime(args.start, "%Y-%m-%d %H:%M").timestamp() if args.start else None
+    except ValueError:
+        print(f'--start must look like "2026-03-29 00:00", got {args.start!r}')
+        return 1
+    if args.hours <= 0:
+        print("--hours must be positive")
+        return 1
+
+    # Load exactly what the scheduler would restore at startup, snapshot plus journal, but
+    # read-only: the scheduler would move an unreadable file aside, a simulation reports it
+    if not os.path.exists(config.schedule_file) and not os.path.exists(config.journal_file):
+        print(f"Could not load schedule: {config.schedule_file} does not exist")
+        return 1
+    try:
+        jobs = JobPersistence(config.schedule_file, config.journal_file).load_schedules(set_aside_corrupt=False)
+    except (IOError, ValueError) as e:
+        print(f"Could not load schedule: {e}")
+        return 1
+    report = simulate(jobs, config, start, args.hours)
+    print_report(report, config.schedule_file)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+
+class TimerHandle:
+    """A single registered timer. Returned by TimerEngine so it can be cancelled later."""
+
+    __slots__ = ("deadline", "interval", "daily_at", "offset", "callback", "cancelled", "tag")
+
+    def __init__(self, deadline, callback, interval=None, daily_at=None, offset=0.0, tag=None):
+        self.deadline = deadline      # Absolute fire time (epoch seconds)
+        self.interval = interval      # Seconds between fires for interval timers
+        self.daily_at = daily_at      # (hour, minute, second) for daily timers
+        self.offset = offset          # Seconds added to every daily/once fire time (jitter spreading)
+        self.callback = callback
+        self.cancelled = False
+        self.tag = tag                # Caller's identifier (the job ID), passed to the callback
+
+    def __repr__(self):
+        fire_at = datetime.fromtimestamp(self.deadline).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        return f"<TimerHandle next={fire_at} interval={self.interval} daily_at={self.daily_at}>"
+
+
+@lru_cache(maxsize=4096)
+def parse_time_of_day(time_value):
+    """
+    Parses 'HH:MM' or 'HH:MM:SS' into an (hour, minute, second) tuple. Raises ValueError if invalid.
+    Cached, so every daily timer at the same time of day shares one tuple.
+    """
+    parts = time_value.split(":")
+    if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+        raise ValueError(f"Invalid time format '{time_value}', expected HH:MM or HH:MM:SS")
+
+    hour, minute = int(parts[0]), int(parts[1])
+    second = int(parts[2]) if len(parts) == 3 else 0
+    if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+        raise ValueError(f"Invalid time of day '{time_value}'")
+    return hour, minute, second
+
+
+def next_daily_deadline(daily_at, after):
+    """Returns the first epoch time strictly after `after` that falls on the given (hour, minute, second)."""
+    hour, minute, second = daily_at
+    base = datetime.fromtimestamp(after)
+    candidate = base.replace(hour=hour, minute=minute, second=second, microsecond=0)
+    if candidate.timestamp() <= after:
+        candidate += timedelta(days=1)
+    return candidate.timestamp()
+
+
+class TimerEngine:
+    """
+    Deadline-driven timer core.
+
+    Timers live in a min-heap keyed by their next fire time, so the run loop only
+    ever looks at the earliest deadline and sleeps until it is due instead of
+    polling every job once per second. Adding or cancelling a timer wakes the
+    loop so a new, earlier deadline is picked up immediately.
+
+    A timer registered with a tag calls `callback(tag)`, otherwise `callback()`. Tagging
+    lets many timers share one callback instead of each holding its own closure.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        # How late the callback that is running now fired. Callbacks read this to measure
+        # their own drift, which lets engines sharing one timer engine keep separate metrics.
+        self.late_by = 0.0
+        self._heap = []
+        self._counter = itertools.count()  # Tie-breaker so equal deadlines keep insertion order
+        self._cond = threading.Condition()
+        self._live = 0
+        self._running = False
+        self._waker = None  # Set while run_async() is active, to wake the event loop from other threads
+
+    def __len__(self):
+        """Number of timers that are still scheduled (cancelled ones are not counted)."""
+        return self._live
+
+    # -----------------------------------------------------------------
+    # Registration
+    # -----------------------------------------------------------------
+
+    # `offset` delays every fire of a timer by a fixed number of seconds, which is how
+    # jobs sharing a fire time are spread out. Drift is measured against the offset deadline.
+
+    def every(self, seconds, callback, tag=None, offset=0.0):
+        """Fires `callback` every `seconds` (floats allowed for sub-second intervals)."""
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0:
+            raise ValueError(f"Interval must be a positive number of seconds, got {seconds!r}")
+        # Re-arming adds the interval to the previous deadline, so the offset carries over by itself
+        handle = TimerHandle(self._clock() + seconds + offset, callback, interval=seconds, tag=tag)
+        self._push(handle)
+        return handle
+
+    def every_day_at(self, time_value, callback, tag=None, offset=0.0):
+        """Fires `callback` every day at 'HH:MM' or 'HH:MM:SS' local time."""
+        daily_at = parse_time_of_day(time_value)
+        deadline = next_daily_deadline(daily_at, self._clock() - offset) + offset
+        handle = TimerHandle(deadline, callback, daily_at=daily_at, offset=offset, tag=tag)
+        self._push(handle)
+        return handle
+
+    def once_at(self, time_value, callback, tag=None, offset=0.0):
+        """Fires `callback` a single time at the next occurrence of 'HH:MM' or 'HH:MM:SS'."""
+        daily_at = parse_time_of_day(time_value)
+        deadline = next_daily_deadline(daily_at, self._clock() - offset) + offset
+        handle = TimerHandle(deadline, callback, offset=offset, tag=tag)
+        self._push(handle)
+        return handle
+
+    def cancel(self, handle):
+        """Cancels a timer. The heap entry is discarded lazily when it reaches the top."""
+        with self._cond:
+            if not handle.cancelled:
+                handle.cancelled = True
+                self._live -= 1
+                # Rebuild the heap if it is mostly dead entries so memory stays bounded
+                if len(self._heap) > 64 and self._live < len(self._heap) // 2:
+                    self._heap = [e for e in self._heap if not e[2].cancelled]
+                    heapq.heapify(self._heap)
+                self._wake()
+
+    def _push(self, handle):
+        with self._cond:
+            heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+            self._live += 1
+            # Wake the run loop in case this deadline is earlier than the one it is sleeping on
+            self._wake()
+
+    def _wake(self):
+        """Wakes whichever run loop is active. Caller holds the lock."""
+        self._cond.notify()
+        if self._waker is not None:
+            self._waker()
+
+    # -----------------------------------------------------------------
+    # Execution
+    # -----------------------------------------------------------------
+
+    def next_deadline(self):
+        """Epoch time of the earliest pending timer, or None when nothing is scheduled."""
+        with self._cond:
+            self._drop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_cancelled(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        """
+        Pops every timer due at `now` and re-arms the recurring ones. Caller holds the lock.
+        Returns (handle, scheduled_deadline) pairs.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, handle = heapq.heappop(self._heap)
+            if handle.cancelled:
+                continue
+            due.append((handle, deadline))
+
+            if handle.interval is not None:
+                # Anchor to the previous deadline so intervals don't drift, but never queue a backlog
+                handle.deadline += handle.interval
+                if handle.deadline <= now:
+                    handle.deadline = now + handle.interval
+            elif handle.daily_at is not None:
+                base = max(now, handle.deadline) - handle.offset
+                handle.deadline = next_daily_deadline(handle.daily_at, base) + handle.offset
+            else:
+                handle.cancelled = True
+                self._live -= 1
+                continue
+            heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+        return due
+
+    def run_pending(self):
+        """Runs every timer that is due right now. Returns the number of callbacks fired."""
+        with self._cond:
+            due = self._pop_due(self._clock())
+
+        for handle, deadline in due:
+            try:
+                self.late_by = self._clock() - deadline
+                if handle.tag is None:
+                    handle.callback()
+                else:
+                    handle.callback(handle.tag)
+            except Exception as e:
+                print(f"[TIMER ERROR] Job callback raised an exception: {e}")
+        return len(due)
+
+    def run_forever(self):
+        """Blocks, sleeping until the next deadline and firing timers as they come due."""
+        self._running = True
+        while self._running:
+            with self._cond:
+                self._drop_cancelled()
+                if self._heap:
+                    timeout = self._heap[0][0] - self._clock()
+                    if timeout > 0:
+                        self._cond.wait(timeout)
+                else:
+                    self._cond.wait()
+            self.run_pending()
+
+    async def run_async(self, before_fire=None):
+        """
+        Asyncio version of run_forever(). `before_fire`, if given, is awaited before each
+        batch of due timers is fired, which lets a publisher apply backpressure.
+        """
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        with self._cond:
+            self._waker = lambda: loop.call_soon_threadsafe(wake.set)
+
+        self._running = True
+        try:
+            while self._running:
+                deadline = self.next_deadline()
+                timeout = None if deadline is None else deadline - self._clock()
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    wake.clear()
+
+                if before_fire is not None:
+                    await before_fire()
+                self.run_pending()
+        finally:
+            with self._cond:
+                self._waker = None
+
+    def stop(self):
+        """Makes run_forever() or run_async() return after the current iteration."""
+        with self._cond:
+            self._running = False
+            self._wake()